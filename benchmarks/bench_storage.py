@@ -0,0 +1,218 @@
+"""Time object round trips through the storage layers that
+Config.get_objects stacks up, for every combination of serializer,
+compressor and encryptor, on a memory filesystem.
+
+Hashing is left out, objects are written to and read from the
+layers below the content addressable store under a fixed key.
+
+Usage: python benchmarks/bench_storage.py [--repeat 20] [--output results.json]
+       pytest benchmarks/bench_storage.py --benchmark-json results.json
+"""
+import argparse
+import itertools
+import json
+import pickle
+import platform
+import time
+
+import fsspec
+import numpy as np
+from cryptography.fernet import Fernet
+
+import igit
+from igit.compression import COMPRESSORS
+from igit.config import Config
+from igit.encryption import ENCRYPTORS
+from igit.serializers import SERIALIZERS
+
+KEY = "0" * 32
+
+
+def make_tree(width, depth):
+    tree = igit.LabelTree()
+    for i in range(width):
+        if depth > 1:
+            tree[f"node_{i}"] = make_tree(width, depth - 1)
+        else:
+            tree[f"leaf_{i}"] = {"name": f"leaf {i}", "values": [i, i + 1]}
+    return tree
+
+
+def make_payloads(array_size=2**17):
+    payloads = {
+        "scalar": 42,
+        "small_dict": {"name": "small", "values": list(range(10)), "x": 1.5},
+        "large_array": np.random.RandomState(0).random_sample(array_size),
+        "nested_tree": make_tree(5, 3),
+    }
+    try:
+        import pandas as pd
+    except ImportError:
+        pass
+    else:
+        n = array_size // 8
+        payloads["dataframe"] = pd.DataFrame({
+            "a": np.arange(n),
+            "b": np.random.RandomState(1).random_sample(n),
+            "c": [f"row {i}" for i in range(n)],
+        })
+    return payloads
+
+
+def unique(registry):
+    """Names of a registry, skipping aliases and noop entries"""
+    names = {}
+    for name, value in registry.items():
+        if not name or name == "noop" or value in names.values():
+            continue
+        names[name] = value
+    return list(names)
+
+
+def matrix():
+    return itertools.product(unique(SERIALIZERS),
+                             ["noop"] + unique(COMPRESSORS),
+                             ["noop"] + unique(ENCRYPTORS))
+
+
+def make_store(serialization, compression, encryption):
+    """The layers of a repo object store below the content
+    addressable store, on a fresh memory filesystem.
+    """
+    kwargs = {}
+    if encryption != "noop":
+        kwargs = {"key": Fernet.generate_key()}
+    config = Config(serialization=serialization,
+                    compression=compression,
+                    encryption=encryption,
+                    encryption_kwargs=kwargs,
+                    object_cache_size=0,
+                    chunk_size=0)
+    path = f"memory://bench_storage/{serialization}-{compression}-{encryption}"
+    mapper = fsspec.get_mapper(path)
+    mapper.clear()
+    return config.get_objects(mapper).d, mapper
+
+
+def roundtrip(store, obj):
+    store[KEY] = obj
+    return store[KEY]
+
+
+def percentiles(times):
+    times = np.array(times) * 1e3
+    return {
+        "mean_ms": float(times.mean()),
+        "p50_ms": float(np.percentile(times, 50)),
+        "p90_ms": float(np.percentile(times, 90)),
+        "p99_ms": float(np.percentile(times, 99)),
+    }
+
+
+def measure(serialization, compression, encryption, name, obj, repeat):
+    result = {
+        "serializer": serialization,
+        "compressor": compression,
+        "encryptor": encryption,
+        "payload": name,
+    }
+    store, mapper = make_store(serialization, compression, encryption)
+    writes, reads = [], []
+    try:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            store[KEY] = obj
+            writes.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            store[KEY]
+            reads.append(time.perf_counter() - start)
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+        return result
+    size = len(pickle.dumps(obj))
+    result.update(
+        write=percentiles(writes),
+        read=percentiles(reads),
+        payload_bytes=size,
+        stored_bytes=sum(len(mapper[k]) for k in mapper if "objects" in k),
+        throughput_mb_s=size * repeat / (sum(writes) + sum(reads)) / 2**20,
+    )
+    return result
+
+
+def run(repeat=20, array_size=2**17, serializers=None, compressors=None,
+        encryptors=None):
+    payloads = make_payloads(array_size)
+    results = []
+    for serialization, compression, encryption in matrix():
+        if serializers and serialization not in serializers:
+            continue
+        if compressors and compression not in compressors:
+            continue
+        if encryptors and encryption not in encryptors:
+            continue
+        for name, obj in payloads.items():
+            results.append(
+                measure(serialization, compression, encryption, name, obj,
+                        repeat))
+    return {
+        "igit": igit.__version__,
+        "python": platform.python_version(),
+        "repeat": repeat,
+        "results": results,
+    }
+
+
+def test_roundtrip(request, serialization, compression, encryption, payload):
+    import pytest
+    pytest.importorskip("pytest_benchmark")
+    benchmark = request.getfixturevalue("benchmark")
+    store, mapper = make_store(serialization, compression, encryption)
+    obj = make_payloads()[payload]
+    try:
+        roundtrip(store, obj)
+    except Exception as e:
+        pytest.skip(f"{serialization} cannot store {payload}: {e}")
+    benchmark.extra_info["stored_bytes"] = sum(
+        len(mapper[k]) for k in mapper if "objects" in k)
+    benchmark(roundtrip, store, obj)
+
+
+def pytest_generate_tests(metafunc):
+    if "serialization" not in metafunc.fixturenames:
+        return
+    metafunc.parametrize("serialization,compression,encryption",
+                         list(matrix()))
+    metafunc.parametrize("payload", list(make_payloads(2**4)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--array-size", type=int, default=2**17)
+    parser.add_argument("--serializers", nargs="*")
+    parser.add_argument("--compressors", nargs="*")
+    parser.add_argument("--encryptors", nargs="*")
+    parser.add_argument("--output", default="bench_storage.json")
+    args = parser.parse_args()
+
+    report = run(repeat=args.repeat,
+                 array_size=args.array_size,
+                 serializers=args.serializers,
+                 compressors=args.compressors,
+                 encryptors=args.encryptors)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    for r in report["results"]:
+        label = (f"{r['serializer']:>12} {r['compressor']:>5} "
+                 f"{r['encryptor']:>6} {r['payload']:>12}")
+        if "error" in r:
+            print(f"{label}: {r['error'][:40]}")
+            continue
+        print(f"{label}: {r['write']['p50_ms']:8.3f} ms write "
+              f"{r['read']['p50_ms']:8.3f} ms read "
+              f"{r['stored_bytes']:>10} bytes")
+
+
+if __name__ == "__main__":
+    main()
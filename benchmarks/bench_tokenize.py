@@ -0,0 +1,60 @@
+"""Compare the repr based and the streaming tokenizers.
+
+Usage: python benchmarks/bench_tokenize.py [--width 30] [--depth 3]
+"""
+import argparse
+import time
+import tracemalloc
+
+import numpy as np
+
+import igit
+from igit.tokenize import TOKENIZERS, get_tokenizer
+
+
+def make_tree(width, depth):
+    tree = igit.LabelTree()
+    for i in range(width):
+        if depth > 1:
+            tree[f"node_{i}"] = make_tree(width, depth - 1)
+        else:
+            tree[f"leaf_{i}"] = {
+                "name": f"leaf {i}",
+                "values": list(range(20)),
+                "array": np.arange(10) * i,
+            }
+    return tree
+
+
+def measure(func, obj, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        token = func(obj)
+    elapsed = (time.perf_counter() - start) / repeat
+    # memory is traced in a separate run, tracing slows down the timing
+    tracemalloc.start()
+    func(obj)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return token, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--width", type=int, default=20)
+    parser.add_argument("--depth", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    tree = make_tree(args.width, args.depth)
+    tokens = set()
+    for name in TOKENIZERS:
+        token, elapsed, peak = measure(get_tokenizer(name), tree, args.repeat)
+        tokens.add(token)
+        print(f"{name:>8}: {elapsed * 1e3:10.1f} ms "
+              f"{peak / 2**20:10.1f} MiB peak")
+    assert len(tokens) == 1, "tokenizers disagree"
+
+
+if __name__ == "__main__":
+    main()
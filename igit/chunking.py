@@ -0,0 +1,84 @@
+import numpy as np
+
+# Fixed random byte -> weight table, the chunk boundaries
+# of a blob must never change between versions.
+CHUNK_TABLE = np.random.RandomState(0x16174).randint(0,
+                                                     2**31,
+                                                     size=256,
+                                                     dtype=np.int64)
+
+
+class Chunker:
+    """Content defined chunking of large byte buffers.
+
+    A cut point is placed wherever the sum of table weights of the
+    last `window` bytes has all its low bits (`mask`) equal to zero,
+    so boundaries depend only on the local content and an edit only
+    changes the chunks around it. The rolling sums are computed
+    with numpy a block at a time.
+    """
+    avg_size: int
+    min_size: int
+    max_size: int
+    threshold: int
+    window: int = 48
+    block_size: int = 2**24
+
+    def __init__(self,
+                 avg_size=2**20,
+                 min_size=None,
+                 max_size=None,
+                 threshold=None,
+                 window=48):
+        self.avg_size = avg_size
+        self.min_size = min_size or avg_size // 4
+        self.max_size = max_size or avg_size * 4
+        self.threshold = threshold or self.max_size
+        self.window = window
+        self.mask = (1 << (avg_size.bit_length() - 1)) - 1
+
+    def should_chunk(self, obj):
+        # manifests only record dtype.str, which loses the fields
+        # of structured dtypes, and reassemble plain bytes or arrays
+        if type(obj) is bytes:
+            return len(obj) >= self.threshold
+        if type(obj) is np.ndarray:
+            dtype = obj.dtype
+            if dtype.hasobject or dtype.fields is not None:
+                return False
+            return obj.nbytes >= self.threshold
+        return False
+
+    def candidates(self, buf):
+        """Positions after which the content allows a cut"""
+        cuts = []
+        w = self.window
+        for start in range(0, len(buf), self.block_size):
+            lo = max(start - w, 0)
+            csum = np.cumsum(CHUNK_TABLE[buf[lo:start + self.block_size]])
+            # sums of the windows ending at block[w:]
+            sums = csum[w:] - csum[:-w]
+            cuts.append(np.flatnonzero((sums & self.mask) == 0) + lo + w + 1)
+        if not cuts:
+            return np.zeros(0, dtype=np.int64)
+        return np.concatenate(cuts)
+
+    def boundaries(self, data):
+        buf = np.frombuffer(data, dtype=np.uint8)
+        n = len(buf)
+        cuts = self.candidates(buf)
+        bounds = []
+        last = 0
+        while last < n:
+            idx = np.searchsorted(cuts, last + self.min_size)
+            end = min(last + self.max_size, n)
+            if idx < len(cuts) and cuts[idx] < end:
+                end = int(cuts[idx])
+            bounds.append((last, end))
+            last = end
+        return bounds
+
+    def split(self, data):
+        """Split a bytes like object into a list of memoryview chunks"""
+        view = memoryview(data).cast("B")
+        return [view[start:end] for start, end in self.boundaries(view)]
@@ -1,3 +1,4 @@
+import threading
 import zlib
 from os import stat
 
@@ -16,3 +17,93 @@ class NoOpCompressor:
 
 COMPRESSORS["noop"] = NoOpCompressor
 COMPRESSORS["zlib"] = zlib
+
+try:
+    import lz4.frame  # `python -m pip install lz4`
+except ImportError:
+    pass
+else:
+    COMPRESSORS["lz4"] = lz4.frame
+
+try:
+    import zstandard  # `python -m pip install zstandard`
+except ImportError:
+    zstandard = None
+else:
+    ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+    class ZstdCompressor:
+        """zstd compression, optionally with a trained dictionary.
+
+        Frames record the id of the dictionary they were compressed
+        with, dictionaries are loaded by id from `dictionaries` on
+        first use so objects written with an older dictionary stay
+        readable. Data that is not a zstd frame is returned as is
+        so a store can move from noop compression to zstd.
+        """
+        level: int
+        dict_id: int
+
+        def __init__(self, level=3, dict_id=None, dictionaries=None):
+            self.level = level
+            self.dict_id = dict_id
+            self.dictionaries = dictionaries
+            self._dicts = {}
+            # zstd contexts are not thread safe
+            self._local = threading.local()
+
+        def with_dictionary(self, dict_id, dictionaries):
+            return self.__class__(level=self.level,
+                                  dict_id=dict_id,
+                                  dictionaries=dictionaries)
+
+        def get_dictionary(self, dict_id):
+            if dict_id not in self._dicts:
+                if self.dictionaries is None:
+                    raise KeyError(f"zstd dictionary {dict_id} not found")
+                self._dicts[dict_id] = zstandard.ZstdCompressionDict(
+                    bytes(self.dictionaries[str(dict_id)]))
+            return self._dicts[dict_id]
+
+        def _compressor(self):
+            compressor = getattr(self._local, "compressor", None)
+            if compressor is None:
+                kwargs = {}
+                if self.dict_id:
+                    kwargs["dict_data"] = self.get_dictionary(self.dict_id)
+                compressor = zstandard.ZstdCompressor(level=self.level,
+                                                      **kwargs)
+                self._local.compressor = compressor
+            return compressor
+
+        def _decompressor(self, dict_id):
+            if not hasattr(self._local, "decompressors"):
+                self._local.decompressors = {}
+            decompressor = self._local.decompressors.get(dict_id)
+            if decompressor is None:
+                kwargs = {}
+                if dict_id:
+                    kwargs["dict_data"] = self.get_dictionary(dict_id)
+                decompressor = zstandard.ZstdDecompressor(**kwargs)
+                self._local.decompressors[dict_id] = decompressor
+            return decompressor
+
+        def compress(self, data):
+            return self._compressor().compress(data)
+
+        def decompress(self, data):
+            if bytes(data[:4]) != ZSTD_MAGIC:
+                return data
+            dict_id = zstandard.get_frame_parameters(data).dict_id
+            return self._decompressor(dict_id).decompress(data)
+
+    COMPRESSORS["zstd"] = ZstdCompressor()
+
+
+def train_zstd_dictionary(samples, dict_size=2**16, level=3):
+    """Train a zstd dictionary on a list of sample payloads."""
+    if zstandard is None:
+        raise ImportError(
+            "zstd dictionaries require `python -m pip install zstandard`")
+    return zstandard.train_dictionary(dict_size, [bytes(s) for s in samples],
+                                      level=level)
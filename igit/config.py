@@ -1,15 +1,17 @@
 import fsspec
 from pydantic import BaseModel
 
-from .compression import COMPRESSORS
-from .encryption import ENCRYPTORS
+from .compression import COMPRESSORS, NoOpCompressor
+from .encryption import ENCRYPTORS, NoOpEncryptor
 from .models import CommitRef, Tag, User
 from .refs import Refs
 from .remotes import Remote
 from .serializers import SERIALIZERS
-from .storage import (ContentAddressableStorage, FunctionStorage,
-                      ObjectStorage, PydanticModelStorage,
-                      SubfolderByKeyStorage, SubfolderStorage)
+from .storage import (AsyncContentAddressableStorage, CachedStorage,
+                      ContentAddressableStorage, FunctionStorage,
+                      IndexedStorage, ObjectStorage, PackedStorage,
+                      PydanticModelStorage, SubfolderByKeyStorage,
+                      SubfolderStorage)
 
 
 class Config(BaseModel):
@@ -20,11 +22,21 @@ class Config(BaseModel):
     igit_path: str = ".igit"
     tree_path: str = None
 
-    serialization: str = "msgpack-dill"
-    hash_func: str = "sha1"
+    serialization: str = "typed"
+    hash_func: str = "md5"
     compression: str = "noop"
+    compression_dict_id: int = None
     encryption: str = "noop"
     encryption_kwargs: dict = None
+    object_cache_size: int = 2**26
+    verify_reads: str = "always"
+    verify_rate: float = 0.1
+    async_concurrency: int = 16
+    deref_workers: int = 8
+    encode_workers: int = 4
+    object_envelope: bool = True
+    chunk_size: int = 2**20
+    tokenizer: str = "stream"
 
     @classmethod
     def from_path(cls, path):
@@ -32,8 +44,18 @@ class Config(BaseModel):
             cfg = cls.parse_raw(f.read())
         return cfg
 
-    def get_compressor(self):
-        return COMPRESSORS[self.compression]
+    def get_compressor(self, store=None):
+        compressor = COMPRESSORS[self.compression]
+        if hasattr(compressor, "with_dictionary"):
+            dictionaries = None
+            if store is not None:
+                dictionaries = self.get_dictionaries(store)
+            compressor = compressor.with_dictionary(self.compression_dict_id,
+                                                    dictionaries)
+        return compressor
+
+    def get_dictionaries(self, store):
+        return SubfolderStorage(store, name='dictionaries')
 
     def get_encryptor(self):
         kwargs = {}
@@ -47,26 +69,45 @@ class Config(BaseModel):
     def get_objects(self, store):
         if isinstance(store, str):
             store = fsspec.get_mapper(store)
+        root = store
+        packs = SubfolderStorage(store, name='packs')
         store = SubfolderStorage(store, name='objects')
+        store = PackedStorage(store, packs)
         encryptor = self.get_encryptor()
-        store = FunctionStorage(
-            store,
-            encryptor.encrypt,
-            encryptor.decrypt,
-        )
+        if not isinstance(encryptor, NoOpEncryptor):
+            store = FunctionStorage(
+                store,
+                encryptor.encrypt,
+                encryptor.decrypt,
+            )
 
-        compressor = self.get_compressor()
-        if compressor is not None:
+        compressor = self.get_compressor(root)
+        if compressor is not None and compressor is not NoOpCompressor:
             store = FunctionStorage(store, compressor.compress,
                                     compressor.decompress)
 
         serializer = self.get_serializer()
         if serializer is not None:
-            store = ObjectStorage(store, serializer=serializer)
+            store = ObjectStorage(store,
+                                  serializer=serializer,
+                                  envelope=self.object_envelope,
+                                  workers=self.encode_workers)
         store = SubfolderByKeyStorage(store)
-        store = ContentAddressableStorage(store)
+        store = IndexedStorage(store, index_store=root, name='objects.idx')
+        if self.object_cache_size:
+            store = CachedStorage(store, max_size=self.object_cache_size)
+        store = ContentAddressableStorage(store,
+                                          verify=self.verify_reads,
+                                          verify_rate=self.verify_rate,
+                                          chunk_size=self.chunk_size,
+                                          tokenizer=self.tokenizer,
+                                          hash_func=self.hash_func)
         return store
 
+    def get_async_objects(self, objects, fs=None):
+        return AsyncContentAddressableStorage(
+            objects, fs=fs, concurrency=self.async_concurrency)
+
     def get_index(self, store):
         store = SubfolderStorage(store, name='index')
         serializer = self.get_serializer()
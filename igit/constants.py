@@ -1,3 +1,6 @@
 CONFIG_NAME = ".igit_config"
 TREECLASS_KEY = '.treeclass'
 HASH_HOOK_NAME = "_igit_hashable_"
+HASH_FUNC_NAME = "HASH_FUNC"
+INDEX_VERSION_NAME = "INDEX_VERSION"
+SYNC_MANIFEST_KEY = ".sync_manifest"
@@ -36,8 +36,8 @@ class Insertion(Patch):
 class Deletion(Patch):
     new: Any = None
 
-    def apply(self, tree):
-        del tree[self.key]
+    def apply(self, key, tree):
+        del tree[key]
 
 
 class Diff(BaseModel):
@@ -50,7 +50,7 @@ class Diff(BaseModel):
             if isinstance(v, dict):
                 self.apply(tree[k])
             else:
-                v.apply(tree)
+                v.apply(k, tree)
 
     def __bool__(self):
         return len(self.diffs)
@@ -94,9 +94,9 @@ class ListHunk(Hunk):
 
 
 def has_diffs(store, t1, t2):
-    t1 = t1.to_merkle_tree(store)
-    t2 = t2.to_merkle_tree(store)
-    return not t1 == t2
+    key1 = store.hash_object(t1, save=False, as_ref=False)
+    key2 = store.hash_object(t2, save=False, as_ref=False)
+    return key1 != key2
     # for k,v in t1.items():
     #     if k not in t2:
     #         return True
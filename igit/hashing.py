@@ -2,12 +2,26 @@ import binascii
 import hashlib
 import json
 from collections.abc import Iterable, Mapping
+from functools import partial
 
 import dill
 import numpy as np
 
 hashers = []  # In decreasing performance order
 
+# hashlib-like constructors for the object id hash of a repo.
+# md5 is the legacy default, blake2b and xxh3-128 are fast but
+# only xxh3 is non-cryptographic, so it should only be used for
+# trusted stores. sha256 is the choice for untrusted stores.
+# Array contents are digested with the same algorithm, except in
+# md5 repos which keep the fast non-cryptographic hash_buffer.
+HASH_ALGORITHMS = {
+    "md5": hashlib.md5,
+    "sha1": hashlib.sha1,
+    "sha256": hashlib.sha256,
+    "blake2b": partial(hashlib.blake2b, digest_size=20),
+}
+
 # Timings on a largish array:
 # - CityHash is 2x faster than MurmurHash
 # - xxHash is slightly slower than CityHash
@@ -47,6 +61,9 @@ else:
 
     hashers.append(_hash_xxhash)
 
+    if hasattr(xxhash, "xxh3_128"):
+        HASH_ALGORITHMS["xxh3-128"] = xxhash.xxh3_128
+
 try:
     import mmh3  # `python -m pip install mmh3`
 except ImportError:
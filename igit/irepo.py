@@ -1,9 +1,12 @@
 import os
 import pathlib
+import random
 import sys
 import time
+import uuid
 from collections import Counter
 from collections.abc import Mapping
+from copy import deepcopy
 from datetime import datetime
 from tokenize import tokenize
 
@@ -13,16 +16,21 @@ from igit import storage
 from igit.storage import object_store
 
 from .config import Config
-from .constants import CONFIG_NAME
+from .compression import train_zstd_dictionary
+from .constants import CONFIG_NAME, HASH_FUNC_NAME, INDEX_VERSION_NAME
 from .diffs import Diff, has_diffs
 from .encryption import ENCRYPTORS
+from .hashing import HASH_ALGORITHMS
 # from .object_store import ObjectStore
 from .models import (AnnotatedTag, Commit, CommitRef, ObjectRef, RepoIndex,
                      Tag, TreeRef, User)
 # from .object_store import ObjectStore
 from .refs import Refs
 # from .igit import IGit
-from .storage import ContentAddressableStorage, ObjectStorage, SubfolderStorage
+from .storage import (AsyncContentAddressableStorage,
+                      ContentAddressableStorage, ObjectStorage, PackedStorage,
+                      SubfolderStorage)
+from .storage.cached import is_immutable
 from .trees import BaseTree, LabelTree, collect_intervals
 from .utils import ls, roundrobin
 from .visualizations import echarts_graph, get_pipeline_dag
@@ -53,6 +61,15 @@ def get_object_ref(key, otype, size=-1):
     raise KeyError(otype)
 
 
+def detach(obj):
+    """Copy of obj that shares no mutable node with it"""
+    if isinstance(obj, BaseTree):
+        return obj.__class__.from_dict({k: detach(v) for k, v in obj.items()})
+    if is_immutable(obj):
+        return obj
+    return deepcopy(obj)
+
+
 class IRepo:
     config: Config
     #     description: str
@@ -60,8 +77,11 @@ class IRepo:
     #     info: str
     objects: ContentAddressableStorage
     refs: Refs
+    async_objects: AsyncContentAddressableStorage = None
     index: ObjectRef = None
     working_tree: BaseTree = None
+    _index_tree: BaseTree = None
+    _index_version: bytes = None
 
     def __init__(self, config, key=None, **kwargs):
         if isinstance(config, pathlib.Path):
@@ -79,15 +99,37 @@ class IRepo:
         repo = fsspec.get_mapper(config.root_path, **kwargs)
 
         igit_folder = SubfolderStorage(repo, name=config.igit_path)
+        self.check_hash_func(igit_folder, config)
 
         self.config = config
+        self.igit_folder = igit_folder
         self.index = config.get_index(igit_folder)
         self.objects = config.get_objects(igit_folder)
         self.refs = config.get_refs(igit_folder)
         self.fstore = repo
+        if getattr(repo.fs, "async_impl", False):
+            self.async_objects = config.get_async_objects(self.objects)
+
+    @staticmethod
+    def check_hash_func(igit_folder, config):
+        """Objects of a repo are all keyed with the hash function
+        recorded when it was created. Repos created before it was
+        recorded were always hashed with md5.
+        """
+        if HASH_FUNC_NAME in igit_folder:
+            recorded = bytes(igit_folder[HASH_FUNC_NAME]).decode()
+        else:
+            recorded = "md5"
+            if config.hash_func == "sha1":
+                # the unused legacy default
+                config.hash_func = recorded
+        if config.hash_func != recorded:
+            raise ValueError(
+                f"Repository objects are hashed with {recorded}, "
+                f"config requests {config.hash_func}.")
 
     def __getitem__(self, name):
-        return self.INDEX_TREE[name]
+        return detach(self.staged_tree()[name])
 
     def __setitem__(self, key, value):
         self.add(**{key: value})
@@ -121,7 +163,12 @@ class IRepo:
                         user=user,
                         root_path=path,
                         **kwargs)
+        if config.hash_func not in HASH_ALGORITHMS:
+            raise ValueError(f"Unknown hash function {config.hash_func}, "
+                             f"available: {sorted(HASH_ALGORITHMS)}")
         storage[CONFIG_NAME] = config.json(indent=3).encode()
+        igit_folder = SubfolderStorage(storage, name=config.igit_path)
+        igit_folder[HASH_FUNC_NAME] = config.hash_func.encode()
 
         repo = cls(config, key=key, connection_kwargs=connection_kwargs)
         return repo
@@ -130,11 +177,24 @@ class IRepo:
     def clone(cls, source, target=None, branch="master", **kwargs):
         if target is None:
             target = "file://" + source.rpartition("/")[-1]
-        repo = cls.init(target, **kwargs)
         source = cls(source)
+        hash_func = kwargs.setdefault("hash_func", source.config.hash_func)
+        if hash_func != source.config.hash_func:
+            raise ValueError(
+                f"Can not clone a repository hashed with "
+                f"{source.config.hash_func} into one hashed with {hash_func}.")
+        repo = cls.init(target, **kwargs)
         head = source.refs.heads[branch]
-        for obj in head.walk(source.objects):
-            repo.objects.hash_object(obj)
+        if source.async_objects is not None:
+            objects = source.async_objects.run(
+                source.async_objects.closure([head.key]))
+        else:
+            objects = source.objects.closure([head.key])
+        if repo.async_objects is not None:
+            repo.async_objects.run(repo.async_objects.put_objects(objects))
+        else:
+            repo.objects.write_many(objects)
+        repo.objects.flush()
 
         repo.refs.heads[branch] = head
         repo.config = source.config
@@ -143,10 +203,6 @@ class IRepo:
         repo.checkout(branch)
         return repo
 
-    @classmethod
-    def clone(cls, url):
-        pass
-
     @property
     def WORKING_TREE(self):
         if self.working_tree is None:
@@ -175,7 +231,33 @@ class IRepo:
 
     @property
     def INDEX_TREE(self):
-        return LabelTree.from_paths_dict(self.index)
+        """Copy of the staged tree, changing it stages nothing"""
+        return detach(self.staged_tree())
+
+    def staged_tree(self):
+        """The staged tree. It is kept in memory and only rebuilt
+        from the index when the version stamp written with every
+        index update has changed since it was loaded. It must not
+        be changed other than through sync_index.
+        """
+        version = self.index_version()
+        if self._index_tree is None or version != self._index_version:
+            self._index_tree = LabelTree.from_paths_dict(self.index)
+            self._index_version = version
+        return self._index_tree
+
+    def index_version(self):
+        try:
+            return bytes(self.igit_folder[INDEX_VERSION_NAME])
+        except KeyError:
+            return None
+
+    def sync_index(self, tree):
+        tree.sync(self.index)
+        version = uuid.uuid4().hex.encode()
+        self.igit_folder[INDEX_VERSION_NAME] = version
+        self._index_tree = tree
+        self._index_version = version
 
     @property
     def detached(self):
@@ -185,7 +267,7 @@ class IRepo:
     def dirty(self):
         if self.working_tree is None:
             return False
-        return (self.WORKING_TREE != self.INDEX_TREE)
+        return (self.WORKING_TREE != self.staged_tree())
 
     def status(self):
         pass
@@ -212,22 +294,24 @@ class IRepo:
         pass
 
     def add(self, **kwargs):
-        index = self.INDEX_TREE
         for k, obj in kwargs.items():
             if not self.objects.consistent_hash(obj):
                 raise ValueError(
                     f"{k} of type {type(obj)} cannot be consistently hashed.")
-            index[k] = obj
-        index.sync(self.index)
-        return index
+        index = self.staged_tree()
+        for k, obj in kwargs.items():
+            index[k] = detach(obj)
+        self.sync_index(index)
+        self.objects.flush()
+        return detach(index)
 
     def rm(self, *keys):
-        index = self.INDEX_TREE
+        index = self.staged_tree()
         for k in keys:
             if k in index:
                 del index[k]
-        index.sync(self.index)
-        return index
+        self.sync_index(index)
+        return detach(index)
 
     def commit(self, message, author=None, commiter=None):
         if author is None:
@@ -241,7 +325,7 @@ class IRepo:
         parents = ()
         if self.HEAD is not None:
             parents = (self.HEAD, )
-        tref = self.objects.hash_object(self.INDEX_TREE)
+        tref = self.objects.hash_object(self.staged_tree())
         commit = Commit(parents=parents,
                         tree=tref,
                         message=message,
@@ -249,9 +333,10 @@ class IRepo:
                         commiter=commiter,
                         timestamp=int(time.time()))
         cref = self.hash_object(commit)
+        self.objects.flush()
         self.refs.heads[self.config.HEAD] = cref
         if self.working_tree is not None:
-            self.working_tree = self.INDEX_TREE
+            self.working_tree = self.deref_tree(tref)
 
         return cref
 
@@ -273,10 +358,11 @@ class IRepo:
             raise TypeError(
                 f'cannot locate branch or commit referenced by {key}')
         commit = ref.deref(self.objects)
-        tree = commit.tree.deref(self.objects)
+        tree = self.deref_tree(commit.tree)
         self.config.HEAD = key
         self.working_tree = tree
-        tree.sync(self.index)
+        # the index gets its own copy of every subtree
+        self.sync_index(self.deref_tree(commit.tree))
         return tree
 
     def branch(self, name=None):
@@ -331,6 +417,7 @@ class IRepo:
                         commiter=commiter,
                         timestamp=int(time.time()))
         cref = self.hash_object(commit)
+        self.objects.flush()
         self.refs.heads[self.config.HEAD] = cref
         return cref
 
@@ -343,8 +430,14 @@ class IRepo:
     def push(self, remote=None):
         pass
 
-    def fs_check(self):
-        pass
+    def fs_check(self, max_workers=8):
+        return self.objects.fs_check(max_workers=max_workers)
+
+    def repack(self, full=False):
+        packed = self.objects.find_layer(PackedStorage)
+        if packed is None:
+            raise TypeError("Object store does not support packs.")
+        return packed.repack(full=full)
 
     def rev_parse(self, key):
         pass
@@ -355,16 +448,24 @@ class IRepo:
     def show_commits(self):
         return self.HEAD.visualize_heritage(self.objects)
 
-    def cat_tree(self, ref, otype="blob"):
+    def deref_tree(self, ref, lazy=False):
+        if lazy:
+            return ref.deref(self.objects, lazy=True)
+        if self.async_objects is not None:
+            return self.async_objects.run(self.async_objects.cat_tree(
+                ref.key))
+        return ref.deref(self.objects, max_workers=self.config.deref_workers)
+
+    def cat_tree(self, ref, otype="blob", lazy=False):
         if isinstance(ref, str):
             ref = self.get_ref(ref)
-        obj = ref.deref(self.objects)
+        obj = self.objects.cat_object(ref.key, deref=False)
         if isinstance(obj, Commit):
-            obj = obj.tree.deref(self.objects)
-        if not isinstance(obj, BaseTree):
+            ref = obj.tree
+        elif not isinstance(obj, BaseTree):
             raise ValueError(
                 f"reference {ref} does not point to a tree or commit.")
-        return obj
+        return self.deref_tree(ref, lazy=lazy)
 
     def diff(self, ref1, ref2, otype="commit"):
         tree1 = ref1.deref(self.objects)
@@ -380,7 +481,8 @@ class IRepo:
                 ref = self.refs.heads[branch]
             else:
                 ref = self.get_ref(branch)
-        return ref.deref_tree(self.objects)
+        commit = ref.deref(self.objects)
+        return self.deref_tree(commit.tree)
 
     def get_ref(self, key):
         if isinstance(key, ObjectRef):
@@ -390,9 +492,9 @@ class IRepo:
         if key in self.refs.tags:
             return self.refs.tags[key]
 
-        obj = self.objects.fuzzy_get(key)
-        ref = self.objects.hash_object(obj)
-        return ref
+        key = self.objects.resolve_key(key)
+        obj = self.objects.cat_object(key, deref=False)
+        return self.objects.get_ref(key, obj)
 
     def find_common_ancestor(self, *branches):
         refs = []
@@ -418,6 +520,35 @@ class IRepo:
         app = igit.server.make_app(self.location)
         uvicorn.run(app, host="0.0.0.0", port=5000, log_level="info")
 
+    def train_compression(self, sample_size=1000, dict_size=2**16, key=None):
+        """Train a zstd dictionary on a sample of the stored objects
+        and use it to compress all objects written from now on.
+        The config is saved since the objects can not be read
+        without it.
+        """
+        if self.config.compression not in ("noop", "zstd"):
+            raise ValueError(f"Can not switch from {self.config.compression} "
+                             "compression to zstd.")
+        codec = self.objects.find_layer(ObjectStorage)
+        keys = list(self.objects.keys())
+        keys = random.sample(keys, min(sample_size, len(keys)))
+        samples = [
+            codec.encode_value(self.objects.cat_object(k, deref=False))
+            for k in keys
+        ]
+        zdict = train_zstd_dictionary(samples, dict_size=dict_size)
+        dict_id = zdict.dict_id()
+        self.config.get_dictionaries(self.igit_folder)[str(dict_id)] = \
+            zdict.as_bytes()
+        self.objects.flush()
+        self.config.compression = "zstd"
+        self.config.compression_dict_id = dict_id
+        self.objects = self.config.get_objects(self.igit_folder)
+        if self.async_objects is not None:
+            self.async_objects = self.config.get_async_objects(self.objects)
+        self.save(key=key)
+        return dict_id
+
     def save(self, key=None):
         # self.ostore["working_tree"] = self.WORKING_TREE
         data = self.config.json(indent=3).encode()
@@ -1,6 +1,6 @@
 from intervaltree import Interval, IntervalTree
 
-from .blob import Blob
+from .blob import Blob, ChunkedBlob
 from .packet import ObjectPacket
 from .reference import *
 from .repo import RepoIndex
@@ -1,7 +1,36 @@
-from typing import ClassVar
+from typing import ClassVar, List, Tuple
+
+import numpy as np
 
 from .base import BaseObject
+from .reference import BlobRef
 
 
 class Blob(BaseObject):
     otype: ClassVar = "blob"
+
+
+class ChunkedBlob(Blob):
+    """Manifest of a large bytes or array blob stored as
+    content defined chunks, dereferencing it reassembles the blob.
+    """
+    chunks: List[BlobRef]
+    size: int
+    dtype: str = None
+    shape: Tuple[int, ...] = None
+
+    def iter_chunks(self, store):
+        """Fetch the chunks one at a time, in order."""
+        for ref in self.chunks:
+            yield store.cat_object(ref.key, deref=False)
+
+    def assemble(self, chunks):
+        data = bytearray()
+        for chunk in chunks:
+            data += chunk
+        if self.dtype is None:
+            return bytes(data)
+        return np.frombuffer(data, dtype=self.dtype).reshape(self.shape)
+
+    def deref(self, store, recursive=True):
+        return self.assemble(self.iter_chunks(store))
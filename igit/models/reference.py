@@ -79,6 +79,15 @@ class TreeRef(ObjectRef):
     otype: ClassVar = "tree"
     tree_class: str = "BaseTree"
 
+    def deref(self, store, recursive=True, max_workers=None, lazy=False):
+        if lazy:
+            tree = store.cat_object(self.key, deref=False)
+            return tree.make_lazy(store)
+        if not (recursive and max_workers):
+            return super().deref(store, recursive=recursive)
+        tree = store.cat_object(self.key, deref=False)
+        return tree.deref(store, recursive=True, max_workers=max_workers)
+
 
 class CommitRef(ObjectRef):
     otype: ClassVar = "commit"
@@ -90,9 +99,9 @@ class CommitRef(ObjectRef):
             for p in pref.walk_parents(store):
                 yield p
 
-    def deref_tree(self, store):
+    def deref_tree(self, store, max_workers=None):
         commit = self.deref(store)
-        return commit.tree.deref(store)
+        return commit.tree.deref(store, max_workers=max_workers)
 
     def deref_parents(self, store):
         commit = self.deref(store)
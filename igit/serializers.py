@@ -1,5 +1,6 @@
 import base64
 import hashlib
+import io
 import json
 import pathlib
 import pickle
@@ -8,12 +9,16 @@ from abc import ABC, abstractmethod, abstractstaticmethod
 import dill
 import msgpack
 import msgpack_numpy as m
+import numpy as np
 from pydantic import BaseModel
 from zict import File, Func
 
+from .utils import Dispatch
+
 m.patch()
 
 SERIALIZERS = {}
+SERIALIZER_IDS = {}
 
 
 class DataCorruptionError(KeyError):
@@ -33,12 +38,15 @@ class ObjectPacket(BaseModel):
 
 class BaseObjectSerializer(ABC):
     NAME: str
+    ID: int = None
     key: bytes
     suffix: str = ''
 
     def __init_subclass__(cls, **kwargs):
         super().__init_subclass__(**kwargs)
         SERIALIZERS[cls.NAME] = cls
+        if cls.ID is not None:
+            SERIALIZER_IDS[cls.ID] = cls
 
     @abstractstaticmethod
     def serialize(obj):
@@ -58,6 +66,7 @@ class BaseObjectSerializer(ABC):
 
 class NoopSerializer(BaseObjectSerializer):
     NAME = None
+    ID = 0
 
     @staticmethod
     def serialize(obj):
@@ -73,6 +82,7 @@ SERIALIZERS[""] = NoopSerializer
 
 class JsonObjectSerializer(BaseObjectSerializer):
     NAME = "json"
+    ID = 1
 
     @staticmethod
     def serialize(obj):
@@ -80,11 +90,12 @@ class JsonObjectSerializer(BaseObjectSerializer):
 
     @staticmethod
     def deserialize(data):
-        return json.loads(data)
+        return json.loads(bytes(data))
 
 
 class PickleObjectSerializer(BaseObjectSerializer):
     NAME = "pickle"
+    ID = 2
     suffix: str = '.pkl'
 
     @staticmethod
@@ -98,6 +109,7 @@ class PickleObjectSerializer(BaseObjectSerializer):
 
 class DillObjectSerializer(BaseObjectSerializer):
     NAME = "dill"
+    ID = 3
     suffix: str = '.dill'
 
     @staticmethod
@@ -111,6 +123,7 @@ class DillObjectSerializer(BaseObjectSerializer):
 
 class MsgpackObjectSerializer(BaseObjectSerializer):
     NAME = "msgpack"
+    ID = 4
     suffix: str = '.msg'
 
     @staticmethod
@@ -124,6 +137,7 @@ class MsgpackObjectSerializer(BaseObjectSerializer):
 
 class MsgpackDillObjectSerializer(BaseObjectSerializer):
     NAME = "msgpack-dill"
+    ID = 5
 
     @staticmethod
     def serialize(obj):
@@ -142,6 +156,7 @@ class MsgpackDillObjectSerializer(BaseObjectSerializer):
 
 class JsonDillObjectSerializer(BaseObjectSerializer):
     NAME = "json-dill"
+    ID = 6
 
     @staticmethod
     def serialize(obj):
@@ -153,6 +168,208 @@ class JsonDillObjectSerializer(BaseObjectSerializer):
     @staticmethod
     def deserialize(data):
         try:
-            return json.loads(data)
+            return json.loads(bytes(data))
         except:
             return dill.loads(data)
+
+
+NPY_MAGIC = np.lib.format.MAGIC_PREFIX
+
+
+def array_to_npy(arr):
+    """.npy header followed by the raw buffer of arr"""
+    if not (arr.flags.c_contiguous or arr.flags.f_contiguous):
+        arr = np.ascontiguousarray(arr)
+    header = io.BytesIO()
+    np.lib.format.write_array_header_1_0(
+        header, np.lib.format.header_data_from_array_1_0(arr))
+    data = arr.reshape(-1, order="A").view(np.uint8)
+    return b"".join([header.getvalue(), data])
+
+
+def npy_to_array(data):
+    """Array viewing the buffer of .npy data, nothing is copied"""
+    view = memoryview(data).cast("B")
+    if view[6] == 1:
+        start = 10 + int.from_bytes(view[8:10], "little")
+        read_header = np.lib.format.read_array_header_1_0
+    else:
+        start = 12 + int.from_bytes(view[8:12], "little")
+        read_header = np.lib.format.read_array_header_2_0
+    fp = io.BytesIO(bytes(view[:start]))
+    np.lib.format.read_magic(fp)
+    shape, fortran_order, dtype = read_header(fp)
+    count = int(np.prod(shape, dtype=np.int64))
+    if not count:
+        return np.empty(shape, dtype=dtype)
+    arr = np.frombuffer(view, dtype=dtype, count=count, offset=start)
+    return arr.reshape(shape, order="F" if fortran_order else "C")
+
+
+class NumpyObjectSerializer(BaseObjectSerializer):
+    """Arrays are written in the .npy format and read back as
+    views of the stored buffer, so arrays loaded from a memory
+    mapped file are not copied. Other objects use msgpack-dill.
+    """
+    NAME = "numpy"
+    ID = 7
+    ZERO_COPY = True
+
+    @staticmethod
+    def serialize(obj):
+        # subclasses such as np.memmap would not round trip
+        if type(obj) is np.ndarray and not obj.dtype.hasobject:
+            return array_to_npy(obj)
+        return MsgpackDillObjectSerializer.serialize(obj)
+
+    @staticmethod
+    def deserialize(data):
+        if bytes(data[:len(NPY_MAGIC)]) == NPY_MAGIC:
+            return npy_to_array(data)
+        return MsgpackDillObjectSerializer.deserialize(data)
+
+
+CODEC_MSGPACK = 1
+CODEC_DILL = 2
+CODEC_NPY = 3
+MSGPACK_TYPES = (bool, int, float, str, bytes, type(None))
+MSGPACK_INT_RANGE = (-2**63, 2**64 - 1)
+
+
+def is_msgpack_native(obj):
+    """Whether msgpack round trips obj unchanged, checked by
+    exact type so subclasses and tuples are not flattened.
+    """
+    t = type(obj)
+    if t is int:
+        return MSGPACK_INT_RANGE[0] <= obj <= MSGPACK_INT_RANGE[1]
+    if t in MSGPACK_TYPES:
+        return True
+    if t is list:
+        return all(is_msgpack_native(v) for v in obj)
+    if t is dict:
+        return all(
+            type(k) is str and is_msgpack_native(v) for k, v in obj.items())
+    return False
+
+
+encode_payload = Dispatch(name="encode_payload")
+
+
+@encode_payload.register(object)
+def encode_dill(obj):
+    return CODEC_DILL, dill.dumps(obj)
+
+
+@encode_payload.register(MSGPACK_TYPES + (list, dict))
+def encode_msgpack(obj):
+    if is_msgpack_native(obj):
+        return CODEC_MSGPACK, msgpack.dumps(obj)
+    return encode_dill(obj)
+
+
+@encode_payload.register(np.ndarray)
+def encode_array(obj):
+    # subclasses such as np.memmap would not round trip
+    if type(obj) is np.ndarray and not obj.dtype.hasobject:
+        return CODEC_NPY, array_to_npy(obj)
+    return encode_dill(obj)
+
+
+PAYLOAD_DECODERS = {
+    CODEC_MSGPACK: msgpack.loads,
+    CODEC_DILL: dill.loads,
+    CODEC_NPY: npy_to_array,
+}
+
+
+class TypedObjectSerializer(BaseObjectSerializer):
+    """Picks the codec from the type of the object and tags the
+    payload with it, so neither writing nor reading an object
+    has to try a codec that fails first. Arrays use the zero
+    copy .npy codec.
+    """
+    NAME = "typed"
+    ID = 9
+    ZERO_COPY = True
+
+    @staticmethod
+    def serialize(obj):
+        codec, data = encode_payload(obj)
+        return b"".join([bytes([codec]), data])
+
+    @staticmethod
+    def deserialize(data):
+        data = memoryview(data).cast("B")
+        return PAYLOAD_DECODERS[data[0]](data[1:])
+
+
+try:
+    import pandas as pd
+    import pyarrow as pa  # `python -m pip install pyarrow`
+except ImportError:
+    pass
+else:
+    ARROW_MAGIC = b"ARROW1"
+    SERIES_KEY = b"igit.series"
+
+    def pandas_to_table(obj):
+        if isinstance(obj, pd.Series):
+            table = pa.Table.from_pandas(obj.to_frame())
+            metadata = dict(table.schema.metadata or {})
+            metadata[SERIES_KEY] = b"1"
+            return table.replace_schema_metadata(metadata)
+        return pa.Table.from_pandas(obj)
+
+    def table_to_pandas(table, columns=None):
+        metadata = table.schema.metadata or {}
+        if columns is not None:
+            # keep the columns the index is rebuilt from
+            index_columns = [
+                c for c in table.schema.pandas_metadata["index_columns"]
+                if isinstance(c, str)
+            ]
+            table = table.select(list(columns) + index_columns)
+        df = table.to_pandas()
+        if SERIES_KEY in metadata:
+            return df.iloc[:, 0]
+        return df
+
+    class ArrowObjectSerializer(NumpyObjectSerializer):
+        """DataFrames and Series are stored in the Arrow IPC file
+        format, reading a subset of their columns only decodes those
+        columns. Arrow does not preserve the block layout pandas
+        tokens depend on, so frames are hashed in their canonical
+        form, the frame they read back as.
+        """
+        NAME = "arrow"
+        ID = 8
+
+        @staticmethod
+        def canonical(obj):
+            if not isinstance(obj, (pd.DataFrame, pd.Series)):
+                return obj
+            try:
+                return table_to_pandas(pandas_to_table(obj))
+            except (pa.ArrowException, TypeError, ValueError):
+                return obj
+
+        @staticmethod
+        def serialize(obj):
+            if isinstance(obj, (pd.DataFrame, pd.Series)):
+                try:
+                    table = pandas_to_table(obj)
+                except (pa.ArrowException, TypeError, ValueError):
+                    return NumpyObjectSerializer.serialize(obj)
+                sink = pa.BufferOutputStream()
+                with pa.ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table)
+                return sink.getvalue().to_pybytes()
+            return NumpyObjectSerializer.serialize(obj)
+
+        @staticmethod
+        def deserialize(data, columns=None):
+            if bytes(data[:len(ARROW_MAGIC)]) == ARROW_MAGIC:
+                reader = pa.ipc.open_file(pa.py_buffer(data))
+                return table_to_pandas(reader.read_all(), columns=columns)
+            return NumpyObjectSerializer.deserialize(data)
@@ -1,6 +1,10 @@
-from .common import ProxyStorage
+from .async_storage import AsyncContentAddressableStorage
+from .cached import CachedStorage
+from .common import AmbiguousKeyError, DataCorruptionError, ProxyStorage
 from .content_addressable import ContentAddressableStorage
 from .function import FunctionStorage
+from .indexed import IndexedStorage, KeyIndex
 from .model import PydanticModelStorage
 from .object_store import ObjectStorage
+from .packed import PackedStorage
 from .subfolder import SubfolderByKeyStorage, SubfolderStorage
@@ -0,0 +1,222 @@
+import asyncio
+import typing as ty
+
+from fsspec.asyn import sync
+from fsspec.mapping import FSMap
+
+from ..models import ChunkedBlob, ObjectRef
+from ..trees import BaseTree
+from .cached import CachedStorage
+from .common import ProxyStorage
+from .indexed import IndexedStorage
+from .packed import PACK_SUFFIX, PackedStorage
+
+
+class AsyncContentAddressableStorage:
+    """Async twin of a ContentAddressableStorage stack.
+
+    Reuses the key layout, codec layers, packs, key index and
+    object cache of the synchronous stack but does its own I/O
+    through an fsspec AsyncFileSystem so many objects can be
+    fetched or written concurrently. At most `concurrency`
+    requests are in flight at any time.
+    """
+    objects: ty.Any
+    fs: ty.Any
+    concurrency: int
+
+    def __init__(self, objects, fs=None, concurrency=16):
+        self.objects = objects
+        self.cache = objects.find_layer(CachedStorage)
+        self.index = objects.find_layer(IndexedStorage)
+        self.packed = objects.find_layer(PackedStorage)
+        self.codec = []
+        store = objects.d
+        while isinstance(store, ProxyStorage):
+            if isinstance(store, PackedStorage):
+                break
+            self.codec.append(store)
+            store = store.d
+        if self.packed is not None:
+            store = self.packed.d
+        self.loose = store
+        if fs is None:
+            fs = self._backend(store).fs
+        if not getattr(fs, "async_impl", False):
+            raise TypeError(f"{fs} is not an async filesystem.")
+        self.fs = fs
+        self.concurrency = concurrency
+
+    @staticmethod
+    def _backend(store):
+        while isinstance(store, ProxyStorage):
+            store = store.d
+        if not isinstance(store, FSMap):
+            raise TypeError(f"{store} is not backed by an fsspec mapper.")
+        return store
+
+    def _path(self, store, key):
+        while isinstance(store, ProxyStorage):
+            key = store.encode_key(key)
+            store = store.d
+        return self._backend(store)._key_to_str(key)
+
+    def encode(self, key, obj):
+        for layer in self.codec:
+            key = layer.encode_key(key)
+            obj = layer.encode_value(obj)
+        return key, obj
+
+    def backend_key(self, key):
+        for layer in self.codec:
+            key = layer.encode_key(key)
+        return key
+
+    def decode(self, data):
+        for layer in reversed(self.codec):
+            data = layer.decode_value(data)
+        return data
+
+    def prepare(self):
+        """Load the pack and key indices up front, they are read
+        with blocking calls which can not run on the fs event loop.
+        """
+        if self.packed is not None:
+            self.packed.indices
+        if self.index is not None:
+            self.index.index
+
+    def run(self, coro):
+        """Run a coroutine of this store from synchronous code."""
+        self.prepare()
+        return sync(self.fs.loop, lambda: coro)
+
+    async def _cat_raw(self, key):
+        key = self.backend_key(key)
+        if self.packed is not None:
+            loc = self.packed.locate(key)
+            if loc is not None:
+                return await self._cat_packed(*loc)
+        try:
+            return await self.fs._cat_file(self._path(self.loose, key))
+        except FileNotFoundError:
+            if self.packed is None:
+                raise
+            loc = self.packed.relocate(key)
+            if loc is None:
+                raise
+        return await self._cat_packed(*loc)
+
+    async def _cat_packed(self, name, offset, length):
+        path = self._path(self.packed.packs, name + PACK_SUFFIX)
+        return await self.fs._cat_file(path,
+                                       start=offset,
+                                       end=offset + length)
+
+    async def _cat_object(self, key, semaphore):
+        if self.cache is not None:
+            try:
+                return self.cache.lookup(key)
+            except KeyError:
+                pass
+        async with semaphore:
+            try:
+                data = await self._cat_raw(key)
+            except FileNotFoundError:
+                raise KeyError(key)
+        obj = self.decode(data)
+        if self.objects.should_verify():
+            self.objects.check_object(key, obj)
+        if self.cache is not None:
+            self.cache.remember(key, obj)
+        return obj
+
+    async def cat_objects(self, keys):
+        """Fetch the stored (not dereferenced) objects for keys."""
+        semaphore = asyncio.Semaphore(self.concurrency)
+        return await asyncio.gather(
+            *[self._cat_object(key, semaphore) for key in keys])
+
+    async def _put_object(self, key, obj, semaphore):
+        key, data = self.encode(key, obj)
+        async with semaphore:
+            await self.fs._pipe_file(self._path(self.loose, key), data)
+
+    async def put_objects(self, objects):
+        """Store a mapping of key -> object, skipping existing keys."""
+        new = {k: v for k, v in objects.items() if k not in self.objects.d}
+        semaphore = asyncio.Semaphore(self.concurrency)
+        await asyncio.gather(
+            *[self._put_object(k, v, semaphore) for k, v in new.items()])
+        for k, v in new.items():
+            if self.index is not None:
+                self.index.record(k)
+            if self.cache is not None:
+                self.cache.remember(k, v)
+        return list(new)
+
+    async def hash_objects(self, objs):
+        """Hash and store objs concurrently, returns their references."""
+        pending = {}
+        refs = []
+        for obj in objs:
+            key, obj = self.objects.collect_object(obj, pending)
+            refs.append(self.objects.get_ref(key, obj))
+        await self.put_objects(pending)
+        return refs
+
+    async def cat_tree(self, key):
+        """Dereference a tree fetching each level of the
+        merkle tree concurrently.
+        """
+        root, = await self.cat_objects([key])
+        if not isinstance(root, BaseTree):
+            return root
+        nodes = []
+        level = [root]
+        while level:
+            slots = []
+            for tree in level:
+                items = dict(tree.items())
+                nodes.append((tree, items))
+                for k, v in items.items():
+                    if isinstance(v, ObjectRef):
+                        slots.append((items, k, v.key))
+            objs = await self.cat_objects([key for _, _, key in slots])
+            level = []
+            chunked = []
+            for (items, k, _), obj in zip(slots, objs):
+                items[k] = obj
+                if isinstance(obj, BaseTree):
+                    level.append(obj)
+                elif isinstance(obj, ChunkedBlob):
+                    chunked.append((items, k, obj))
+            chunks = await asyncio.gather(*[
+                self.cat_objects([ref.key for ref in manifest.chunks])
+                for _, _, manifest in chunked
+            ])
+            for (items, k, manifest), data in zip(chunked, chunks):
+                items[k] = manifest.assemble(data)
+        derefed = {}
+        for tree, items in reversed(nodes):
+            items = {
+                k: derefed.get(id(v), v) if isinstance(v, BaseTree) else v
+                for k, v in items.items()
+            }
+            derefed[id(tree)] = tree.__class__.from_dict(items)
+        return derefed[id(root)]
+
+    async def closure(self, keys):
+        """All stored objects reachable from keys, as key -> object"""
+        objects = {}
+        level = list(keys)
+        while level:
+            level = [k for k in dict.fromkeys(level) if k not in objects]
+            objs = await self.cat_objects(level)
+            next_level = []
+            for key, obj in zip(level, objs):
+                objects[key] = obj
+                next_level.extend(
+                    ref.key for ref in self.objects.references(obj))
+            level = next_level
+        return objects
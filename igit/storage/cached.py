@@ -0,0 +1,135 @@
+import sys
+import threading
+import typing as ty
+from copy import deepcopy
+from numbers import Number
+
+from zict import LRU
+
+from ..models import BaseObject
+from ..tokenize import is_frozen
+from ..utils import Dispatch
+from .common import ProxyStorage, setitems
+
+sizeof = Dispatch(name="sizeof")
+
+
+@sizeof.register(object)
+def sizeof_default(obj):
+    nbytes = getattr(obj, "nbytes", None)
+    if isinstance(nbytes, int):
+        return nbytes + 100
+    return sys.getsizeof(obj)
+
+
+@sizeof.register((list, tuple, set, frozenset))
+def sizeof_sequence(seq):
+    return sys.getsizeof(seq) + sum(sizeof(item) for item in seq)
+
+
+@sizeof.register(dict)
+def sizeof_dict(d):
+    return sys.getsizeof(d) + sum(
+        sizeof(k) + sizeof(v) for k, v in d.items())
+
+
+IMMUTABLE_TYPES = (Number, str, bytes, type(None))
+
+
+def is_immutable(obj):
+    if isinstance(obj, IMMUTABLE_TYPES):
+        return True
+    if isinstance(obj, (tuple, frozenset)):
+        return all(is_immutable(item) for item in obj)
+    return is_frozen(obj)
+
+
+class CachedStorage(ProxyStorage):
+    """Size bounded LRU cache of decoded objects.
+    Objects are content addressed so cached values never need
+    to be invalidated. Mutable values are copied on the way out
+    so callers can not corrupt the cache.
+    """
+    d: ty.Mapping
+    max_size: int
+    hits: int = 0
+    misses: int = 0
+
+    def __init__(self, d, max_size=2**26):
+        self.d = d
+        self.max_size = max_size
+        self.cache = LRU(max_size, {}, weight=self._weight)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _weight(key, value):
+        return sizeof(value)
+
+    @staticmethod
+    def _export(value):
+        if is_immutable(value):
+            return value
+        if isinstance(value, BaseObject):
+            return value.copy(deep=True)
+        return deepcopy(value)
+
+    def lookup(self, key):
+        with self._lock:
+            try:
+                value = self.cache[key]
+            except KeyError:
+                self.misses += 1
+                raise
+            self.hits += 1
+        return self._export(value)
+
+    def remember(self, key, value):
+        value = self._export(value)
+        with self._lock:
+            self.cache[key] = value
+
+    def __getitem__(self, key):
+        try:
+            return self.lookup(key)
+        except KeyError:
+            pass
+        value = self.d[key]
+        self.remember(key, value)
+        return value
+
+    def __setitem__(self, key, value):
+        self.d[key] = value
+        self.remember(key, value)
+
+    def setitems(self, items):
+        items = dict(items)
+        setitems(self.d, items)
+        for key, value in items.items():
+            self.remember(key, value)
+
+    def __delitem__(self, key):
+        with self._lock:
+            self.cache.pop(key, None)
+        del self.d[key]
+
+    def __contains__(self, key):
+        return key in self.cache or key in self.d
+
+    def clear_cache(self):
+        self.cache.clear()
+
+    def info(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": self.cache.total_weight,
+            "max_size": self.max_size,
+            "count": len(self.cache),
+        }
+
+    def __str__(self):
+        return f"<CachedStorage: {self.max_size} bytes -> {self.d}>"
+
+    __repr__ = __str__
@@ -1,4 +1,6 @@
+import os
 import typing as ty
+from collections import deque
 from collections.abc import MutableMapping
 
 import fsspec
@@ -8,6 +10,48 @@ class DataCorruptionError(KeyError):
     pass
 
 
+class AmbiguousKeyError(KeyError):
+    pass
+
+
+def is_local(fs):
+    protocol = fs.protocol
+    if isinstance(protocol, str):
+        protocol = (protocol, )
+    return "file" in protocol
+
+
+def setitems(d, items):
+    """Write a mapping of key -> value to d, as a single
+    batch if d supports it.
+    """
+    if isinstance(d, fsspec.mapping.FSMap):
+        # FSMap.setitems does not create the parent directories
+        # that FSMap.__setitem__ does.
+        parents = {d.fs._parent(d._key_to_str(k)) for k in items}
+        for parent in parents:
+            d.fs.mkdirs(parent, exist_ok=True)
+    if hasattr(d, "setitems"):
+        d.setitems(items)
+    else:
+        for k, v in items.items():
+            d[k] = v
+
+
+def bounded_map(func, iterable, executor, max_pending):
+    """Like executor.map, but only submits items while fewer than
+    max_pending results are waiting to be consumed. Results are
+    yielded in order.
+    """
+    pending = deque()
+    for item in iterable:
+        if len(pending) >= max_pending:
+            yield pending.popleft().result()
+        pending.append(executor.submit(func, item))
+    while pending:
+        yield pending.popleft().result()
+
+
 class ProxyStorage(MutableMapping):
     """MutableMapping that proxies its data
     access to another mapping. Meant to be subclassed
@@ -63,3 +107,75 @@ class ProxyStorage(MutableMapping):
 
     def __contains__(self, key):
         return key in self.d
+
+    def encode_key(self, key):
+        """Key this layer passes down to self.d for key"""
+        return key
+
+    def encode_value(self, value):
+        """Value this layer passes down to self.d for value"""
+        return value
+
+    def decode_value(self, data):
+        """Inverse of encode_value"""
+        return data
+
+    def setitems(self, items):
+        """Encode a mapping of key -> value and pass it
+        down to self.d as a single batch.
+        """
+        items = {
+            self.encode_key(k): self.encode_value(v)
+            for k, v in dict(items).items()
+        }
+        setitems(self.d, items)
+
+    def flush(self):
+        if hasattr(self.d, "flush"):
+            self.d.flush()
+
+    def cat_range(self, key, start, end):
+        """Read the bytes [start, end) of the value stored under key
+        without fetching the whole value where the backend allows it.
+        """
+        if hasattr(self.d, "cat_range"):
+            return self.d.cat_range(key, start, end)
+        if isinstance(self.d, fsspec.mapping.FSMap):
+            path = self.d._key_to_str(key)
+            return self.d.fs.cat_file(path, start=start, end=end)
+        return self.d[key][start:end]
+
+    def locate_local(self, key):
+        """Path, offset and length of the bytes stored under key
+        if they are stored unchanged in a local file, otherwise None.
+        """
+        key = self.encode_key(key)
+        if hasattr(self.d, "locate_local"):
+            return self.d.locate_local(key)
+        if isinstance(self.d, fsspec.mapping.FSMap) and is_local(self.d.fs):
+            path = self.d._key_to_str(key)
+            try:
+                return path, 0, os.path.getsize(path)
+            except OSError:
+                return None
+        return None
+
+    def has_local_files(self):
+        """Whether locate_local can find the stored bytes, objects
+        stored in local files unchanged.
+        """
+        if hasattr(self.d, "has_local_files"):
+            return self.d.has_local_files()
+        return isinstance(self.d, fsspec.mapping.FSMap) and is_local(
+            self.d.fs)
+
+    def find_layer(self, cls):
+        """Walk down the storage stack and return
+        the first layer that is an instance of cls.
+        """
+        store = self
+        while store is not None:
+            if isinstance(store, cls):
+                return store
+            store = getattr(store, "d", None)
+        return None
@@ -1,27 +1,72 @@
+import random
 import sys
 import typing as ty
 from collections.abc import MutableMapping
+from concurrent.futures import ThreadPoolExecutor
 
-from ..models import BaseObject, BlobRef, ObjectRef, TreeRef
-from ..tokenize import tokenize
+import numpy as np
+
+from ..chunking import Chunker
+from ..models import BaseObject, BlobRef, ChunkedBlob, ObjectRef, TreeRef
+from ..tokenize import TokenMemo, get_tokenizer, is_frozen
 from ..trees import BaseTree
-from .common import DataCorruptionError, ProxyStorage
+from .cached import CachedStorage
+from .common import (AmbiguousKeyError, DataCorruptionError, ProxyStorage,
+                     setitems)
+from .indexed import IndexedStorage
+from .object_store import ObjectStorage
+
+VERIFY_MODES = ("always", "sampled", "off")
 
 
 class ContentAddressableStorage(ProxyStorage):
-    verify: bool
-    hash_func: ty.Callable
+    verify: str
+    verify_rate: float
+    hash_func: str
+    chunker: Chunker = None
+    chunk_arrays: bool = True
+    canonical: ty.Callable = None
 
     def __init__(
         self,
         d: MutableMapping,
-        verify=True,
+        verify="always",
+        verify_rate=0.1,
+        chunk_size=None,
+        tokenizer="repr",
+        hash_func="md5",
     ):
         self.d = d
+        self.hash_func = hash_func
+        self.tokenize = get_tokenizer(tokenizer, hash_func)
+        self.tokens = TokenMemo()
+        if chunk_size:
+            self.chunker = Chunker(avg_size=chunk_size)
+        objects = self.find_layer(ObjectStorage)
+        if (chunk_size and objects is not None and objects.zero_copy
+                and objects.has_local_files()):
+            # whole arrays read back as views of a memory map,
+            # chunked ones have to be reassembled in memory
+            self.chunk_arrays = False
+        # trees cache their merkle keys per hashing scheme
+        self.token_id = (hash_func, chunk_size or None)
+        if not self.chunk_arrays:
+            self.token_id += ("whole arrays", )
+        if getattr(getattr(objects, "serializer", None), "canonical", None):
+            # hash objects the way they read back
+            self.canonical = objects.canonical
+        if verify is True:
+            verify = "always"
+        elif verify is False or verify is None:
+            verify = "off"
+        if verify not in VERIFY_MODES:
+            raise ValueError(
+                f"verify must be one of {VERIFY_MODES}, got {verify}")
         self.verify = verify
+        self.verify_rate = verify_rate
 
     def hash(self, obj) -> str:
-        return tokenize(obj)
+        return self.tokens.get(obj, self.tokenize)
 
     def get_ref(self, key, obj):
         size = sys.getsizeof(obj)
@@ -41,44 +86,210 @@ class ContentAddressableStorage(ProxyStorage):
             ref = BlobRef(key=key, size=size)
         return ref
 
-    def hash_object(self, obj, save=True, as_ref=True):
+    def collect_object(self, obj, pending=None):
+        """Hash obj without saving it.
+
+        Trees are replaced by merkle trees of references and every
+        object that would be stored is added to pending, children
+        before their parents. Returns the key and the object to store.
+        """
         if isinstance(obj, BaseTree):
+            cached = obj.cached_merkle(self.token_id)
+            if cached is not None and (pending is None or cached[0] in self.d):
+                return cached
             new_obj = obj.__class__()
+            subtrees = []
+            frozen = True
             for k, v in obj.items():
-                new_obj[k] = self.hash_object(v, save=save)
-            obj = new_obj
+                if isinstance(v, BaseTree):
+                    subtrees.append(v)
+                key, stored = self.collect_object(v, pending)
+                new_obj[k] = self.get_ref(key, stored)
+                if isinstance(v, BaseTree):
+                    frozen = frozen and v.cached_merkle(self.token_id)
+                else:
+                    frozen = frozen and is_frozen(v)
+            key = self.hash(new_obj)
+            if pending is not None:
+                pending[key] = new_obj
+            if frozen:
+                obj.cache_merkle(self.token_id, key, new_obj, subtrees)
+            return key, new_obj
+        elif self.should_chunk(obj):
+            obj = self.chunk_object(obj, pending)
+        elif self.canonical is not None:
+            obj = self.canonical(obj)
         key = self.hash(obj)
-        if save and key not in self.d:
-            self.d[key] = obj
+        if pending is not None:
+            pending[key] = obj
+        return key, obj
+
+    def should_chunk(self, obj):
+        if self.chunker is None or not self.chunker.should_chunk(obj):
+            return False
+        return self.chunk_arrays or not isinstance(obj, np.ndarray)
+
+    def write_many(self, objects):
+        """Store a mapping of key -> object, skipping existing keys.
+        New objects are encoded and written as a single batch.
+        """
+        new = {k: v for k, v in objects.items() if k not in self.d}
+        if new:
+            setitems(self.d, new)
+        return list(new)
+
+    def chunk_object(self, obj, pending=None):
+        """Split a large bytes or array blob into content defined
+        chunks, returns the manifest that replaces it.
+        Unchanged chunks hash to existing keys and are not rewritten.
+        """
+        dtype = shape = None
+        if isinstance(obj, np.ndarray):
+            dtype, shape = obj.dtype.str, obj.shape
+            obj = np.ascontiguousarray(obj).reshape(-1).view(np.uint8)
+        chunks = []
+        size = 0
+        for chunk in self.chunker.split(obj):
+            chunk = bytes(chunk)
+            key = self.hash(chunk)
+            if pending is not None:
+                pending[key] = chunk
+            chunks.append(self.get_ref(key, chunk))
+            size += len(chunk)
+        return ChunkedBlob(chunks=chunks, size=size, dtype=dtype, shape=shape)
+
+    def hash_object(self, obj, save=True, as_ref=True):
+        pending = {} if save else None
+        key, obj = self.collect_object(obj, pending)
+        if save:
+            self.write_many(pending)
         if as_ref:
             key = self.get_ref(key, obj)
         return key
 
+    def hash_objects(self, objs, save=True, as_ref=True):
+        """Hash many objects, storing everything new in one batch."""
+        pending = {} if save else None
+        keys = []
+        for obj in objs:
+            key, obj = self.collect_object(obj, pending)
+            keys.append(self.get_ref(key, obj) if as_ref else key)
+        if save:
+            self.write_many(pending)
+        return keys
+
+    @staticmethod
+    def references(obj):
+        """References held by a stored object"""
+        if isinstance(obj, BaseTree):
+            return [v for v in obj.values() if isinstance(v, ObjectRef)]
+        refs = []
+        if isinstance(obj, ObjectRef):
+            refs.append(obj)
+        if isinstance(obj, BaseObject):
+            for attr in obj.__dict__.values():
+                if isinstance(attr, ObjectRef):
+                    refs.append(attr)
+                elif isinstance(attr, (list, tuple)):
+                    refs.extend(a for a in attr if isinstance(a, ObjectRef))
+        return refs
+
+    def closure(self, keys):
+        """All stored objects reachable from keys, as key -> object"""
+        objects = {}
+        level = list(keys)
+        while level:
+            next_level = []
+            for key in level:
+                if key in objects:
+                    continue
+                obj = self.cat_object(key, deref=False)
+                objects[key] = obj
+                next_level.extend(ref.key for ref in self.references(obj))
+            level = next_level
+        return objects
+
+    def should_verify(self):
+        if self.verify == "always":
+            return True
+        if self.verify == "sampled":
+            return random.random() < self.verify_rate
+        return False
+
+    def check_object(self, key, obj):
+        # Stored trees hold references to their children, each child
+        # is checked on its own when it is read so hashing the stored
+        # object is enough to verify the key.
+        key2 = self.hash(obj)
+        if key2 != key:
+            raise DataCorruptionError(
+                f"Looks like data has been corrupted or a different "
+                f"serializer/encryption was used. key: {key}, hash: {key2}")
+
     def cat_object(self, key, deref=True, recursive=True):
         obj = self.d[key]
+        if self.should_verify():
+            self.check_object(key, obj)
         if deref and hasattr(obj, 'deref'):
             obj = obj.deref(self, recursive=recursive)
-        if self.verify:
-            key2 = self.hash_object(obj, save=False, as_ref=False)
-            if key2 != key:
-                raise DataCorruptionError(
-                    f"Looks like data has been corrupted or\
-                     a different serializer/encryption was used. key: {key}, hash: {key2}"
-                )
         return obj
 
+    def cat_columns(self, key, columns):
+        """Read only the given columns of a stored DataFrame.
+        Needs a serializer that can decode a subset of columns,
+        such as arrow. The projection is not verified against key.
+        """
+        store = self.d
+        while not isinstance(store, ObjectStorage):
+            key = store.encode_key(key)
+            store = store.d
+        return store.read(key, columns=list(columns))
+
+    def _check_key(self, store, key):
+        try:
+            self.check_object(key, store[key])
+        except Exception as e:
+            return key, str(e)
+        return key, None
+
+    def fs_check(self, keys=None, max_workers=8):
+        """Verify every stored object against its key.
+
+        Objects are read in parallel, bypassing the object cache.
+        Returns a dict of corrupt key -> error message.
+        """
+        store = self.d
+        if isinstance(store, CachedStorage):
+            store = store.d
+        if keys is None:
+            keys = list(store.keys())
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = executor.map(lambda k: self._check_key(store, k), keys)
+            return {k: error for k, error in results if error is not None}
+
     def get(self, key, default=None):
-        if key not in self.d:
+        try:
+            return self[key]
+        except KeyError:
             return default
-        return self[key]
+
+    def resolve_key(self, prefix):
+        """Expand an abbreviated key to the full key."""
+        indexed = self.find_layer(IndexedStorage)
+        if indexed is not None:
+            return indexed.resolve_prefix(prefix)
+        if prefix in self.d:
+            return prefix
+        matches = [k for k in self.d.keys() if k.startswith(prefix)]
+        if not matches:
+            raise KeyError(prefix)
+        if len(matches) > 1:
+            raise AmbiguousKeyError(
+                f"{prefix} is ambiguous, candidates: {matches[:10]}")
+        return matches[0]
 
     def fuzzy_get(self, key):
-        if key in self.d:
-            return self.d[key]
-        for k in self.d.keys():
-            if key in k:
-                return self.d[k]
-        raise KeyError(key)
+        return self.d[self.resolve_key(key)]
 
     def equal(self, *objs):
         return set([self.hash(obj) for obj in objs]) == 1
@@ -8,3 +8,18 @@ from .common import ProxyStorage
 class FunctionStorage(Func, ProxyStorage):
     def __init__(self, d, dump, load):
         super().__init__(dump, load, d)
+
+    def cat_range(self, key, start, end):
+        return self[key][start:end]
+
+    def locate_local(self, key):
+        return None
+
+    def has_local_files(self):
+        return False
+
+    def encode_value(self, value):
+        return self.dump(value)
+
+    def decode_value(self, data):
+        return self.load(data)
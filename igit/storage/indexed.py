@@ -0,0 +1,179 @@
+import threading
+import typing as ty
+from bisect import bisect_left
+
+from .common import AmbiguousKeyError, ProxyStorage, setitems
+
+
+class KeyIndex:
+    """Sorted set of keys that can be persisted as a single blob."""
+    keys: list
+
+    def __init__(self, keys=()):
+        self.keys = sorted(set(keys))
+
+    @classmethod
+    def from_bytes(cls, data):
+        index = cls()
+        if data:
+            index.keys = bytes(data).decode().split("\n")
+        return index
+
+    def to_bytes(self):
+        return "\n".join(self.keys).encode()
+
+    def add(self, key):
+        idx = bisect_left(self.keys, key)
+        if idx < len(self.keys) and self.keys[idx] == key:
+            return False
+        self.keys.insert(idx, key)
+        return True
+
+    def discard(self, key):
+        idx = bisect_left(self.keys, key)
+        if idx < len(self.keys) and self.keys[idx] == key:
+            del self.keys[idx]
+            return True
+        return False
+
+    def __contains__(self, key):
+        idx = bisect_left(self.keys, key)
+        return idx < len(self.keys) and self.keys[idx] == key
+
+    def match_prefix(self, prefix, limit=None):
+        matches = []
+        idx = bisect_left(self.keys, prefix)
+        while idx < len(self.keys) and self.keys[idx].startswith(prefix):
+            matches.append(self.keys[idx])
+            if limit is not None and len(matches) >= limit:
+                break
+            idx += 1
+        return matches
+
+    def __iter__(self):
+        return iter(self.keys)
+
+    def __len__(self):
+        return len(self.keys)
+
+
+class IndexedStorage(ProxyStorage):
+    """Keeps a persistent index of the keys in the underlying
+    storage so membership checks never list the store.
+    The index is loaded once, updated on every write and
+    saved to index_store every flush_every new keys and
+    whenever flush() is called. A stale index can only
+    miss keys, which costs a redundant write at worst.
+    """
+    d: ty.Mapping
+    index_store: ty.Mapping
+    name: str
+    flush_every: int
+
+    def __init__(self, d, index_store=None, name="keys.idx",
+                 flush_every=1000):
+        self.d = d
+        self.index_store = index_store
+        self.name = name
+        self.flush_every = flush_every
+        self._index = None
+        self._pending = 0
+        self._lock = threading.RLock()
+
+    @property
+    def index(self):
+        if self._index is None:
+            with self._lock:
+                if self._index is None:
+                    self._index = self._load_index()
+        return self._index
+
+    def _load_index(self):
+        if self.index_store is not None and self.name in self.index_store:
+            return KeyIndex.from_bytes(self.index_store[self.name])
+        index = KeyIndex(self.d.keys())
+        self._pending = len(index)
+        return index
+
+    def rebuild(self):
+        self._index = KeyIndex(self.d.keys())
+        self._pending = len(self._index)
+        self.flush()
+        return self._index
+
+    def flush(self):
+        with self._lock:
+            if self._pending and self.index_store is not None:
+                self.index_store[self.name] = self.index.to_bytes()
+            self._pending = 0
+        super().flush()
+
+    def record(self, key):
+        """Add a key written to self.d out of band to the index"""
+        self._record(key)
+
+    def _record(self, key):
+        with self._lock:
+            if self.index.add(key):
+                self._pending += 1
+                if self._pending >= self.flush_every:
+                    self.flush()
+
+    def __getitem__(self, key):
+        value = self.d[key]
+        if key not in self.index:
+            self._record(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self.d[key] = value
+        self._record(key)
+
+    def setitems(self, items):
+        items = dict(items)
+        setitems(self.d, items)
+        for key in items:
+            self._record(key)
+
+    def __delitem__(self, key):
+        del self.d[key]
+        if self.index.discard(key):
+            self._pending += 1
+            self.flush()
+
+    def __contains__(self, key):
+        return key in self.index
+
+    def resolve_prefix(self, prefix):
+        """Return the unique key starting with prefix.
+
+        Falls back to a single listing of the store if the index
+        has no match, to pick up keys written by other processes.
+        """
+        matches = self.index.match_prefix(prefix, limit=2)
+        if not matches:
+            for key in self.d.keys():
+                if key.startswith(prefix):
+                    self._record(key)
+            matches = self.index.match_prefix(prefix, limit=2)
+        if not matches:
+            raise KeyError(prefix)
+        if len(matches) > 1:
+            candidates = self.index.match_prefix(prefix, limit=10)
+            raise AmbiguousKeyError(
+                f"{prefix} is ambiguous, candidates: {candidates}")
+        return matches[0]
+
+    def keys(self):
+        return self.d.keys()
+
+    def __iter__(self):
+        yield from self.d.keys()
+
+    def __len__(self):
+        return len(self.index)
+
+    def __str__(self):
+        return f"<IndexedStorage: {self.name} -> {self.d}>"
+
+    __repr__ = __str__
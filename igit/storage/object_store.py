@@ -1,23 +1,53 @@
 import base64
+import mmap
+import struct
 import typing as ty
 from collections.abc import MutableMapping
+from concurrent.futures import ThreadPoolExecutor
 
 from ..models import ObjectPacket
-from ..serializers import SERIALIZERS
-from .common import ProxyStorage
+from ..serializers import SERIALIZER_IDS, SERIALIZERS
+from ..trees import BaseTree
+from .common import ProxyStorage, bounded_map, setitems
+from .function import FunctionStorage
+
+# 0xc1 is never used by msgpack and pickle/json payloads
+# never start with it so enveloped objects are unambiguous.
+ENVELOPE_MAGIC = b"\xc1IG"
+ENVELOPE_VERSION = 1
+# magic, version, otype id, serializer id, payload length
+ENVELOPE_HEADER = struct.Struct(">3sBBBQ")
+OTYPES = ("object", "blob", "tree", "commit", "merge")
+OTYPE_IDS = {otype: i for i, otype in enumerate(OTYPES)}
+UNKNOWN_SERIALIZER_ID = 255
 
 
 class ObjectStorage(ProxyStorage):
     d: ty.Mapping
     serializer: ty.Any
     suffix: str = ''
-
-    def __init__(self, d: MutableMapping, serializer=None, suffix=''):
+    envelope: bool = False
+    workers: int = None
+    max_pending: int = None
+    batch_bytes: int = 2**26
+
+    def __init__(self,
+                 d: MutableMapping,
+                 serializer=None,
+                 suffix='',
+                 envelope=False,
+                 workers=None,
+                 max_pending=None,
+                 batch_bytes=2**26):
         self.d = d
         if isinstance(serializer, str):
             serializer = SERIALIZERS.get(serializer, None)
         self.serializer = serializer
         self.suffix = suffix
+        self.envelope = envelope
+        self.workers = workers
+        self.max_pending = max_pending or 2 * (workers or 1)
+        self.batch_bytes = batch_bytes
 
     @staticmethod
     def bytes_to_string(data):
@@ -32,23 +62,117 @@ class ObjectStorage(ProxyStorage):
             return obj
         return self.serializer.serialize(obj)
 
-    def deserialize(self, data):
+    def deserialize(self, data, **options):
         if self.serializer is None:
             return data
-        return self.serializer.deserialize(data)
+        return self.serializer.deserialize(data, **options)
+
+    @staticmethod
+    def otype(obj):
+        if isinstance(obj, BaseTree):
+            return "tree"
+        return getattr(obj, "otype", "blob")
 
     def pack_object(self, obj):
+        """Serialize obj into a binary envelope, a fixed size
+        header followed by the raw serialized payload.
+        """
         data = self.serialize(obj)
-        pack = ObjectPacket(
-            otype=obj.otype,
-            content=self.bytes_to_string(data),
+        serializer_id = getattr(self.serializer, "ID", None)
+        if serializer_id is None:
+            serializer_id = UNKNOWN_SERIALIZER_ID
+        header = ENVELOPE_HEADER.pack(
+            ENVELOPE_MAGIC,
+            ENVELOPE_VERSION,
+            OTYPE_IDS.get(self.otype(obj), 0),
+            serializer_id,
+            len(data),
         )
-        return pack
+        return header + data
 
-    def unpack_object(self, packet):
-        data = self.string_to_bytes(packet.content)
-        obj = self.deserialize(data)
-        return obj
+    @staticmethod
+    def is_envelope(data):
+        return (isinstance(data, (bytes, bytearray, memoryview))
+                and bytes(data[:len(ENVELOPE_MAGIC)]) == ENVELOPE_MAGIC)
+
+    @staticmethod
+    def read_header(data):
+        magic, version, otype_id, serializer_id, length = \
+            ENVELOPE_HEADER.unpack_from(data)
+        if version != ENVELOPE_VERSION:
+            raise ValueError(f"Unsupported envelope version {version}")
+        return OTYPES[otype_id], serializer_id, length
+
+    def unpack_object(self, data, **options):
+        """Inverse of pack_object. Also reads ObjectPackets and raw
+        serialized payloads written without an envelope.
+        The payload is passed to the serializer as a memoryview
+        so it is never copied. options are passed on to the
+        serializer.
+        """
+        if isinstance(data, ObjectPacket):
+            return self.deserialize(self.string_to_bytes(data.content),
+                                    **options)
+        if not self.is_envelope(data):
+            return self.deserialize(data, **options)
+        otype, serializer_id, length = self.read_header(data)
+        start = ENVELOPE_HEADER.size
+        payload = memoryview(data)[start:start + length]
+        serializer = SERIALIZER_IDS.get(serializer_id, self.serializer)
+        if serializer is None:
+            return payload
+        return serializer.deserialize(payload, **options)
+
+    def canonical(self, obj):
+        """The object obj reads back as"""
+        canonical = getattr(self.serializer, "canonical", None)
+        if canonical is None:
+            return obj
+        return canonical(obj)
+
+    def encode_key(self, key):
+        return key + self.suffix
+
+    def encode_value(self, value):
+        if self.envelope:
+            return self.pack_object(value)
+        return self.serialize(value)
+
+    def decode_value(self, data):
+        return self.unpack_object(data)
+
+    def setitems(self, items):
+        """Serialize a batch and run it through the function layers
+        below, compression and encryption, on a pool of workers.
+        At most max_pending encoded objects wait to be written and
+        they are passed on in order, in batches of up to batch_bytes.
+        """
+        items = dict(items)
+        if not self.workers or len(items) < 2:
+            return super().setitems(items)
+        stages = [self]
+        store = self.d
+        while isinstance(store, FunctionStorage):
+            stages.append(store)
+            store = store.d
+
+        def encode(item):
+            key, value = item
+            for stage in stages:
+                key, value = stage.encode_key(key), stage.encode_value(value)
+            return key, value
+
+        batch, size = {}, 0
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for key, data in bounded_map(encode, items.items(), executor,
+                                         self.max_pending):
+                batch[key] = data
+                size += len(data)
+                if size >= self.batch_bytes:
+                    setitems(store, batch)
+                    batch, size = {}, 0
+        if batch:
+            setitems(store, batch)
 
     def get_mapper(self):
         return IGitFunc(self.serialize, self.deserialize, self.d)
@@ -61,13 +185,45 @@ class ObjectStorage(ProxyStorage):
     def keys(self):
         return [k.strip(self.suffix) for k in self.d.keys()]
 
-    def __getitem__(self, key):
+    @property
+    def zero_copy(self):
+        return getattr(self.serializer, "ZERO_COPY", False)
+
+    def read(self, key, **options):
+        """Read the object stored under key passing options, such
+        as the columns to decode, to its serializer.
+        """
         key = key + self.suffix
-        return self.deserialize(self.d[key])
+        if self.zero_copy and hasattr(self.d, "locate_local"):
+            loc = self.d.locate_local(key)
+            if loc is not None and loc[2]:
+                try:
+                    return self.load_local(*loc, **options)
+                except OSError:
+                    # removed by a repack since it was located
+                    pass
+        return self.unpack_object(self.d[key], **options)
+
+    def load_local(self, path, offset, length, **options):
+        """Decode an object stored in a local file from a memory map,
+        serializers that support it return views of the map.
+        """
+        start = offset - offset % mmap.ALLOCATIONGRANULARITY
+        with open(path, "rb") as f:
+            buf = mmap.mmap(f.fileno(),
+                            offset - start + length,
+                            access=mmap.ACCESS_READ,
+                            offset=start)
+        offset -= start
+        return self.unpack_object(memoryview(buf)[offset:offset + length],
+                                  **options)
+
+    def __getitem__(self, key):
+        return self.read(key)
 
     def __setitem__(self, key, value):
         key = key + self.suffix
-        self.d[key] = self.serialize(value)
+        self.d[key] = self.encode_value(value)
 
     def __delitem__(self, key):
         key = key + self.suffix
@@ -82,4 +238,4 @@ class ObjectStorage(ProxyStorage):
 
     def __contains__(self, key):
         key = key + self.suffix
-        return key in self.d.keys()
+        return key in self.d
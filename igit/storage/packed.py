@@ -0,0 +1,234 @@
+import hashlib
+import json
+import typing as ty
+from bisect import bisect_left
+
+from .common import ProxyStorage
+
+PACK_SUFFIX = ".pack"
+INDEX_SUFFIX = ".idx"
+
+
+class PackIndex:
+    """Sorted offset table of the objects stored in a single pack."""
+    keys: list
+    offsets: list
+    lengths: list
+
+    def __init__(self, keys=(), offsets=(), lengths=()):
+        self.keys = list(keys)
+        self.offsets = list(offsets)
+        self.lengths = list(lengths)
+
+    @classmethod
+    def from_bytes(cls, data):
+        return cls(**json.loads(data))
+
+    def to_bytes(self):
+        return json.dumps({
+            "keys": self.keys,
+            "offsets": self.offsets,
+            "lengths": self.lengths,
+        }).encode()
+
+    def find(self, key):
+        idx = bisect_left(self.keys, key)
+        if idx < len(self.keys) and self.keys[idx] == key:
+            return self.offsets[idx], self.lengths[idx]
+        return None
+
+    def remove(self, key):
+        idx = bisect_left(self.keys, key)
+        if idx < len(self.keys) and self.keys[idx] == key:
+            del self.keys[idx]
+            del self.offsets[idx]
+            del self.lengths[idx]
+            return True
+        return False
+
+    def __contains__(self, key):
+        return self.find(key) is not None
+
+    def __iter__(self):
+        return iter(self.keys)
+
+    def __len__(self):
+        return len(self.keys)
+
+
+class PackedStorage(ProxyStorage):
+    """Object storage that reads from pack files as well
+    as from loose objects. Each pack is a single blob of
+    concatenated values with a sorted index next to it so
+    many small objects cost a single PUT to write and a
+    ranged GET each to read. New objects are written loose,
+    call repack() to move them into a pack.
+    """
+    d: ty.Mapping
+    packs: ty.Mapping
+
+    def __init__(self, d, packs):
+        self.d = d
+        self.packs = packs
+        self._indices = None
+
+    @property
+    def indices(self):
+        if self._indices is None:
+            indices = {}
+            for name in list(self.packs.keys()):
+                if name.endswith(INDEX_SUFFIX):
+                    pack_name = name[:-len(INDEX_SUFFIX)]
+                    indices[pack_name] = PackIndex.from_bytes(
+                        self.packs[name])
+            self._indices = indices
+        return self._indices
+
+    def reload(self):
+        self._indices = None
+
+    def relocate(self, key):
+        """Location of key after reloading the pack indices, another
+        handle may have packed it since they were loaded.
+        """
+        self.reload()
+        return self.locate(key)
+
+    def locate(self, key):
+        for name, index in self.indices.items():
+            loc = index.find(key)
+            if loc is not None:
+                return name, loc[0], loc[1]
+        return None
+
+    def packed_keys(self):
+        keys = set()
+        for index in self.indices.values():
+            keys.update(index)
+        return keys
+
+    def loose_keys(self):
+        return list(self.d.keys())
+
+    def _read_packed(self, name, offset, length):
+        return self.packs.cat_range(name + PACK_SUFFIX, offset,
+                                    offset + length)
+
+    def locate_local(self, key):
+        loc = self.locate(key)
+        if loc is None:
+            return super().locate_local(key)
+        name, offset, length = loc
+        if not hasattr(self.packs, "locate_local"):
+            return None
+        pack = self.packs.locate_local(name + PACK_SUFFIX)
+        if pack is None:
+            return None
+        return pack[0], pack[1] + offset, length
+
+    def has_local_files(self):
+        return (super().has_local_files()
+                and hasattr(self.packs, "has_local_files")
+                and self.packs.has_local_files())
+
+    def __getitem__(self, key):
+        loc = self.locate(key)
+        try:
+            if loc is not None:
+                return self._read_packed(*loc)
+            return self.d[key]
+        except (KeyError, FileNotFoundError):
+            loc = self.relocate(key)
+            if loc is None:
+                raise
+        return self._read_packed(*loc)
+
+    def __setitem__(self, key, value):
+        self.d[key] = value
+
+    def __delitem__(self, key):
+        if key in self.d:
+            del self.d[key]
+            return
+        loc = self.locate(key)
+        if loc is None:
+            raise KeyError(key)
+        name = loc[0]
+        index = self.indices[name]
+        index.remove(key)
+        self.packs[name + INDEX_SUFFIX] = index.to_bytes()
+
+    def __contains__(self, key):
+        if self.locate(key) is not None:
+            return True
+        return key in self.d
+
+    def keys(self):
+        keys = self.packed_keys()
+        keys.update(self.loose_keys())
+        return sorted(keys)
+
+    def __iter__(self):
+        yield from self.keys()
+
+    def __len__(self):
+        return len(self.keys())
+
+    def write_pack(self, items):
+        """Write a mapping of key -> bytes as a single pack.
+
+        The pack blob is written before its index so readers
+        never see an index pointing at missing data.
+        """
+        items = sorted(dict(items).items())
+        if not items:
+            return None
+        index = PackIndex()
+        chunks = []
+        offset = 0
+        for key, value in items:
+            value = bytes(value)
+            index.keys.append(key)
+            index.offsets.append(offset)
+            index.lengths.append(len(value))
+            chunks.append(value)
+            offset += len(value)
+        data = b"".join(chunks)
+        name = "pack-" + hashlib.sha1(data).hexdigest()
+        self.packs[name + PACK_SUFFIX] = data
+        self.packs[name + INDEX_SUFFIX] = index.to_bytes()
+        self.indices[name] = index
+        return name
+
+    def repack(self, full=False):
+        """Move all loose objects into a new pack.
+
+        If full is True the existing packs are merged into
+        the new pack as well and then removed.
+        """
+        loose = self.loose_keys()
+        items = {k: self.d[k] for k in loose if self.locate(k) is None}
+        old_packs = []
+        if full:
+            old_packs = list(self.indices)
+            for name in old_packs:
+                index = self.indices[name]
+                data = self.packs[name + PACK_SUFFIX]
+                for k, offset, length in zip(index.keys, index.offsets,
+                                             index.lengths):
+                    items.setdefault(k, data[offset:offset + length])
+        name = self.write_pack(items)
+        for name_ in old_packs:
+            if name_ == name:
+                continue
+            del self.packs[name_ + INDEX_SUFFIX]
+            del self.packs[name_ + PACK_SUFFIX]
+            self.indices.pop(name_, None)
+        for k in loose:
+            del self.d[k]
+        return name
+
+    def __str__(self):
+        return f"<PackedStorage: {len(self.indices)} packs -> {self.d}>"
+
+    __repr__ = __str__
@@ -40,6 +40,12 @@ class SubfolderStorage(ProxyStorage):
         key = self.long_key(key)
         del self.d[key]
 
+    def cat_range(self, key, start, end):
+        return super().cat_range(self.long_key(key), start, end)
+
+    def encode_key(self, key):
+        return self.long_key(key)
+
     def keys(self):
         for k in self.d.keys():
             if k and k.startswith(self.prefix):
@@ -91,6 +97,24 @@ class SubfolderByKeyStorage(SubfolderStorage):
     def short_key(self, key):
         return key[:self.n] + key[self.n + len(self.sep):]
 
+    def _is_long_key(self, key):
+        return key[self.n:self.n + len(self.sep)] == self.sep
+
+    def keys(self):
+        for k in self.d.keys():
+            if k and self._is_long_key(k):
+                yield self.short_key(k)
+
+    def values(self):
+        for k in list(self.d.keys()):
+            if k and self._is_long_key(k):
+                yield self.d[k]
+
+    def items(self):
+        for k in list(self.d.keys()):
+            if k and self._is_long_key(k):
+                yield self.short_key(k), self.d[k]
+
     def __str__(self):
         return f"<SubfolderStorage: key[:{self.n}]{self.sep}key[{self.n}:] -> value>"
 
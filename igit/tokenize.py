@@ -1,9 +1,13 @@
+import contextvars
 import datetime
 import inspect
+import mmap
 import os
 import pickle
+import sys
 import threading
 import uuid
+import weakref
 from collections import OrderedDict
 from concurrent.futures import Executor
 from contextlib import contextmanager
@@ -14,11 +18,14 @@ from numbers import Number
 from operator import getitem
 from typing import Iterator, Mapping, Set
 
+import numpy as np
 from packaging.version import parse as parse_version
+from pydantic import BaseModel
 from tlz import curry, groupby, identity, merge
 from tlz.functoolz import Compose
+from zict import LRU
 
-from .hashing import hash_buffer_hex
+from .hashing import HASH_ALGORITHMS, hash_buffer_hex
 from .utils import Dispatch
 
 
@@ -31,13 +38,135 @@ def tokenize(*args, **kwargs):
     """
     if kwargs:
         args = args + (kwargs, )
-    return md5(str(tuple(map(normalize_token, args))).encode()).hexdigest()
+    return repr_token(args)
+
+
+def repr_token(args, hasher=md5):
+    """Hash of the repr of the normalized args"""
+    return hasher(str(tuple(map(normalize_token, args))).encode()).hexdigest()
 
 
 def are_equal(a, b):
     return tokenize(a) == tokenize(b)
 
 
+def is_frozen(obj):
+    """Whether obj can never change after it was created"""
+    if isinstance(obj, (str, bytes, Number, type(None))):
+        return True
+    if isinstance(obj, tuple):
+        return all(is_frozen(item) for item in obj)
+    if isinstance(obj, np.ndarray):
+        if obj.dtype.hasobject or obj.flags.writeable:
+            return False
+        # an array that owns its memory, or views one, can be made
+        # writeable again, only arrays over immutable buffers are frozen
+        base = obj.base
+        while isinstance(base, np.ndarray):
+            base = base.base
+        return is_frozen_buffer(base)
+    if isinstance(obj, BaseModel):
+        config = obj.__config__
+        if config.allow_mutation and not getattr(config, "frozen", False):
+            return False
+        return all(is_frozen(v) for v in obj.__dict__.values())
+    return False
+
+
+def is_frozen_buffer(buf):
+    """Whether the memory exported by buf can never change"""
+    if isinstance(buf, bytes):
+        return True
+    if isinstance(buf, memoryview):
+        return buf.readonly and is_frozen_buffer(buf.obj)
+    if isinstance(buf, mmap.mmap):
+        try:
+            return memoryview(buf).readonly
+        except ValueError:
+            return False
+    return False
+
+
+class TokenMemo:
+    """Tokens of immutable objects keyed by their identity.
+
+    Objects that support weak references are tracked with them,
+    others are kept alive by a size bounded LRU so their id can
+    not be reused while their token is cached. Objects smaller
+    than min_size are cheaper to tokenize than to look up.
+    bytes are not memoized, they can not be weakly referenced
+    and are mostly fresh buffers, such as chunks, that the LRU
+    would only keep alive.
+    """
+    min_size: int
+    max_size: int
+
+    def __init__(self, min_size=2**10, max_size=2**26):
+        self.min_size = min_size
+        self.max_size = max_size
+        self.weak = {}
+        self.strong = LRU(max_size, {}, weight=self._weight)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _weight(key, value):
+        obj = value[0]
+        return getattr(obj, "nbytes", None) or sys.getsizeof(obj)
+
+    def memoizable(self, obj):
+        if isinstance(obj, np.ndarray):
+            if obj.nbytes < self.min_size:
+                return False
+        elif not isinstance(obj, BaseModel):
+            return False
+        return is_frozen(obj)
+
+    def lookup(self, obj):
+        key = id(obj)
+        entry = self.weak.get(key)
+        if entry is not None and entry[0]() is obj:
+            return entry[1]
+        with self._lock:
+            entry = self.strong.get(key)
+        if entry is not None and entry[0] is obj:
+            return entry[1]
+        raise KeyError(key)
+
+    def remember(self, obj, token):
+        key = id(obj)
+        try:
+            # the callback runs before the id can be reused
+            ref = weakref.ref(obj, lambda _: self.weak.pop(key, None))
+        except TypeError:
+            with self._lock:
+                self.strong[key] = (obj, token)
+        else:
+            self.weak[key] = (ref, token)
+
+    def get(self, obj, func):
+        """Memoized func(obj)"""
+        if not self.memoizable(obj):
+            return func(obj)
+        try:
+            token = self.lookup(obj)
+        except KeyError:
+            pass
+        else:
+            self.hits += 1
+            return token
+        self.misses += 1
+        token = func(obj)
+        self.remember(obj, token)
+        return token
+
+    def clear(self):
+        self.weak.clear()
+        with self._lock:
+            self.strong.clear()
+
+
 normalize_token = Dispatch()
 normalize_token.register(
     (
@@ -146,6 +275,133 @@ def _normalize_function(func):
             return str(func)
 
 
+class TokenStream:
+    """Buffered text sink that feeds an incremental hash object."""
+    def __init__(self, hasher, buffer_size=2**16):
+        self.hasher = hasher
+        self.buffer_size = buffer_size
+        self.parts = []
+        self.size = 0
+
+    def write(self, text):
+        self.parts.append(text)
+        self.size += len(text)
+        if self.size >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        self.hasher.update("".join(self.parts).encode())
+        self.parts = []
+        self.size = 0
+
+    def hexdigest(self):
+        self.flush()
+        return self.hasher.hexdigest()
+
+
+def stream_tokenize(*args, **kwargs):
+    """Same token as tokenize, but containers are normalized while
+    their text is fed into the hash instead of building the full
+    normalized structure and its repr in memory first.
+    >>> stream_tokenize([1, 2, '3']) == tokenize([1, 2, '3'])
+    True
+    """
+    if kwargs:
+        args = args + (kwargs, )
+    return stream_token_args(args)
+
+
+def stream_token_args(args, hasher=md5):
+    """Hash of the repr of the normalized args, streamed"""
+    stream = TokenStream(hasher())
+    stream.write("(")
+    for i, arg in enumerate(args):
+        if i:
+            stream.write(", ")
+        stream_token(arg, stream)
+    if len(args) == 1:
+        stream.write(",")
+    stream.write(")")
+    return stream.hexdigest()
+
+
+TOKENIZERS = {
+    "repr": repr_token,
+    "stream": stream_token_args,
+}
+
+
+# name of the hash algorithm array buffers are digested with,
+# None for the fast non-cryptographic hash_buffer_hex
+BUFFER_HASH = contextvars.ContextVar("buffer_hash", default=None)
+
+
+def digest_buffer(buf):
+    name = BUFFER_HASH.get()
+    if name is None:
+        return hash_buffer_hex(buf)
+    return HASH_ALGORITHMS[name](buf).hexdigest()
+
+
+def get_tokenizer(name="repr", hash_func="md5"):
+    """tokenize function using the named tokenizer and hash algorithm.
+    Array contents are digested with the same algorithm, except
+    for md5 which keeps the fast buffer hash of existing repos.
+    """
+    if hash_func not in HASH_ALGORITHMS:
+        raise ValueError(f"Unknown hash function {hash_func}, "
+                         f"available: {sorted(HASH_ALGORITHMS)}")
+    token_args = TOKENIZERS[name]
+    hasher = HASH_ALGORITHMS[hash_func]
+    buffer_hash = None if hash_func == "md5" else hash_func
+
+    def tokenize_(*args, **kwargs):
+        if kwargs:
+            args = args + (kwargs, )
+        if buffer_hash is None:
+            return token_args(args, hasher)
+        reset = BUFFER_HASH.set(buffer_hash)
+        try:
+            return token_args(args, hasher)
+        finally:
+            BUFFER_HASH.reset(reset)
+
+    return tokenize_
+
+# stream_token(obj, stream) writes repr(normalize_token(obj)) to stream
+stream_token = Dispatch(name="stream_token")
+
+
+@stream_token.register(object)
+def stream_object(obj, stream):
+    stream.write(repr(normalize_token(obj)))
+
+
+@stream_token.register((tuple, list))
+def stream_seq(seq, stream):
+    if normalize_token.dispatch(type(seq)) is not normalize_seq:
+        return stream_object(seq, stream)
+    stream.write(f"({type(seq).__name__!r}, [")
+    for i, item in enumerate(seq):
+        if i:
+            stream.write(", ")
+        stream_token(item, stream)
+    stream.write("])")
+
+
+@stream_token.register(dict)
+def stream_dict(d, stream):
+    if normalize_token.dispatch(type(d)) is not normalize_dict:
+        return stream_object(d, stream)
+    if all(type(k) is str for k in d):
+        # str keys never have a repr that is a prefix of another
+        # so ordering by the key alone matches ordering by str(item)
+        items = sorted(d.items(), key=lambda item: repr(item[0]))
+    else:
+        items = sorted(d.items(), key=str)
+    stream_seq(items, stream)
+
+
 @normalize_token.register_lazy("pandas")
 def register_pandas():
     import pandas as pd
@@ -192,7 +448,8 @@ def register_pandas():
 
     @normalize_token.register(pd.DataFrame)
     def normalize_dataframe(df):
-        mgr = df._data
+        # _data was removed in pandas 3, _mgr is the same object
+        mgr = df._mgr if hasattr(df, "_mgr") else df._data
 
         if PANDAS_GT_130:
             # for compat with ArrayManager, pandas 1.3.0 introduced a `.arrays`
@@ -223,6 +480,18 @@ def register_pandas():
         return normalize_token(dtype.name)
 
 
+# normalized tokens of read only arrays, per buffer hash
+ARRAY_TOKENS = TokenMemo()
+BUFFER_HASH_TOKENS = {}
+
+
+def array_tokens():
+    name = BUFFER_HASH.get()
+    if name is None:
+        return ARRAY_TOKENS
+    return BUFFER_HASH_TOKENS.setdefault(name, TokenMemo())
+
+
 @normalize_token.register_lazy("numpy")
 def register_numpy():
     import numpy as np
@@ -249,27 +518,30 @@ def register_numpy():
                 x.strides,
                 offset,
             )
+        return array_tokens().get(x, normalize_array_data)
+
+    def normalize_array_data(x):
         if x.dtype.hasobject:
             try:
                 try:
                     # string fast-path
-                    data = hash_buffer_hex("-".join(x.flat).encode(
+                    data = digest_buffer("-".join(x.flat).encode(
                         encoding="utf-8", errors="surrogatepass"))
                 except UnicodeDecodeError:
                     # bytes fast-path
-                    data = hash_buffer_hex(b"-".join(x.flat))
+                    data = digest_buffer(b"-".join(x.flat))
             except (TypeError, UnicodeDecodeError):
                 try:
-                    data = hash_buffer_hex(
+                    data = digest_buffer(
                         pickle.dumps(x, pickle.HIGHEST_PROTOCOL))
                 except Exception:
                     # pickling not supported, use UUID4-based fallback
                     data = uuid.uuid4().hex
         else:
             try:
-                data = hash_buffer_hex(x.ravel(order="K").view("i1"))
+                data = digest_buffer(x.ravel(order="K").view("i1"))
             except (BufferError, AttributeError, ValueError):
-                data = hash_buffer_hex(x.copy().ravel(order="K").view("i1"))
+                data = digest_buffer(x.copy().ravel(order="K").view("i1"))
         return (data, x.dtype, x.shape, x.strides)
 
     @normalize_token.register(np.matrix)
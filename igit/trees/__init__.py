@@ -1,4 +1,6 @@
 from .base import BaseTree
 from .configs import ConfigTree
-from .intervals import IntIntervalTree, TimeIntervalTree, collect_intervals
+from .intervals import (ColumnarIntIntervalTree, IntIntervalTree,
+                        TimeIntervalTree, collect_intervals)
 from .labels import LabelTree
+from .persistent import PersistentLabelTree
@@ -1,17 +1,21 @@
+import json
 import re
 import sys
+import weakref
 from abc import ABC, abstractclassmethod, abstractmethod, abstractstaticmethod
 from collections import UserDict, defaultdict
 from collections.abc import Iterable, Mapping, MutableMapping
+from concurrent.futures import ThreadPoolExecutor
 from copy import copy
+from functools import lru_cache
 from pydoc import locate
 
 import fsspec
 import numpy as np
 
-from igit.tokenize import normalize_token, tokenize
+from igit.tokenize import normalize_token, stream_object, stream_token
 
-from ..constants import TREECLASS_KEY
+from ..constants import SYNC_MANIFEST_KEY, TREECLASS_KEY
 from ..diffs import Edit, Patch
 from ..models import ObjectRef  # , BlobRef, TreeRef, Commit, Tag
 from ..utils import class_fullname, dict_to_treelib, equal
@@ -28,6 +32,11 @@ class KeyTypeError(TypeError):
 
 class BaseTree(MutableMapping):
     TREE_CLASSES = []
+    _store = None
+    _lazy_keys = frozenset()
+    _merkle_keys = None
+    _parents = ()
+    _synced_objects = None
 
     def __init_subclass__(cls, **kwargs):
         super().__init_subclass__(**kwargs)
@@ -88,16 +97,44 @@ class BaseTree(MutableMapping):
         return paths
 
     def sync(self, m: MutableMapping, sep='/'):
+        """Write the tree to m as a flat mapping of paths.
+
+        A manifest of the merkle keys of the synced subtrees and the
+        tokens of their values is kept in m, later syncs skip the
+        subtrees whose key did not change, only write the paths whose
+        token changed and delete the paths that are gone. Frozen
+        values are not hashed again, see ContentAddressableStorage.hash.
+        m is expected to only be written through sync, without a
+        manifest all paths are written.
+        """
+        from ..storage.common import setitems
+
         if hasattr(m, 'fs'):
             sep = m.fs.sep
-        paths = self.to_paths_dict(sep=sep)
-        for k in m.keys():
-            if k.startswith('.'):
+        old = read_manifest(m)
+        changed, stale = {}, []
+        if old is None:
+            stale = [k for k in m.keys() if not k.startswith('.')]
+        try:
+            ref = weakref.ref(m)
+        except TypeError:
+            ref = None
+        synced = self._synced_objects
+        if synced is None or synced[0]() is not m:
+            synced = (ref or (lambda: None), {})
+        manifest = sync_node(self, old, '', sep, changed, stale, synced[1])
+        for k in stale:
+            if k in changed:
                 continue
-            if k not in paths:
+            try:
                 del m[k]
-        for k, v in paths.items():
-            m[k] = v
+            except KeyError:
+                pass
+        if changed:
+            setitems(m, changed)
+        m[SYNC_MANIFEST_KEY] = json.dumps(manifest).encode()
+        if ref is not None:
+            self._synced_objects = synced
         return m
 
     def persist(self, path, serializer="msgpack-dill"):
@@ -178,15 +215,47 @@ class BaseTree(MutableMapping):
     def to_merkle_tree(self, store):
         tree = self.__class__()
         for k, v in sorted(self.items()):
-            if isinstance(v, BaseTree):
-                v = v.to_merkle_tree(store)
             tree[k] = store.hash_object(v)
         return tree
 
+    def cached_merkle(self, token_id):
+        """Cached (key, merkle tree) of self for a hashing scheme"""
+        if self._merkle_keys is None:
+            return None
+        return self._merkle_keys.get(token_id)
+
+    def cache_merkle(self, token_id, key, merkle_tree, subtrees=()):
+        """Remember the merkle tree of self until self or one of
+        its subtrees changes.
+        """
+        if self._merkle_keys is None:
+            self._merkle_keys = {}
+        self._merkle_keys[token_id] = (key, merkle_tree)
+        for tree in subtrees:
+            if not any(ref() is self for ref in tree._parents):
+                tree._parents = tree._parents + (weakref.ref(self), )
+
+    def touch(self):
+        """Drop the cached merkle trees of self and its ancestors"""
+        self._merkle_keys = None
+        parents, self._parents = self._parents, ()
+        for ref in parents:
+            parent = ref()
+            if parent is not None:
+                parent.touch()
+
+    def merkle_key(self):
+        """Key of the merkle tree of self, computed without
+        storing anything.
+        """
+        return _merkle_hasher().hash_object(self, save=False, as_ref=False)
+
     def hash_tree(self, store):
         return self.hash_object(store, self)
 
-    def deref(self, store, recursive=True):
+    def deref(self, store, recursive=True, max_workers=None):
+        if recursive and max_workers:
+            return deref_parallel(self, store, max_workers=max_workers)
         d = {}
         for k, v in self.items():
             if recursive and hasattr(v, "deref"):
@@ -194,6 +263,44 @@ class BaseTree(MutableMapping):
             d[k] = v
         return self.__class__.from_dict(d)
 
+    def make_lazy(self, store):
+        """Turn a merkle tree into a lazy view of the tree it
+        references. Values are loaded from store on first access
+        and memoized, subtrees are loaded lazily as well.
+        """
+        self._store = store
+        self._lazy_keys = set(self.keys())
+        return self
+
+    @property
+    def is_lazy(self):
+        return bool(self._lazy_keys)
+
+    def _load(self, key, value):
+        if key not in self._lazy_keys:
+            return value
+        obj = self._store.cat_object(value.key, deref=False)
+        if isinstance(obj, BaseTree):
+            obj.make_lazy(self._store)
+        elif hasattr(obj, "deref"):
+            obj = obj.deref(self._store)
+        self._lazy_keys.discard(key)
+        self._set_loaded(key, value, obj)
+        return obj
+
+    def load_all(self):
+        for key in sorted(self._lazy_keys):
+            self._load(key, self._get_raw(key))
+        return self
+
+    @abstractmethod
+    def _get_raw(self, key):
+        pass
+
+    @abstractmethod
+    def _set_loaded(self, key, old, new):
+        pass
+
     def _hash_object(self, store, obj, otype):
         return store.hash_object(obj)
 
@@ -214,7 +321,7 @@ class BaseTree(MutableMapping):
     def __eq__(self, other):
         if not isinstance(other, self.__class__):
             return False
-        return tokenize(self) == tokenize(other)
+        return self.merkle_key() == other.merkle_key()
 
     def _igit_hash_object_(self, odb):
         return self.hash_tree(odb)
@@ -255,8 +362,11 @@ class BaseTree(MutableMapping):
         diff = self.diff(other)
         return get_edits(diff)
 
+    def copy(self):
+        return self.__class__.from_dict(self.to_dict())
+
     def apply_diff(self, diff):
-        result = self.__class__.from_dict(self.to_dict())
+        result = self.copy()
         for k, v in diff.items():
             if isinstance(v, Patch):
                 v.apply(k, result)
@@ -265,6 +375,125 @@ class BaseTree(MutableMapping):
         return result
 
 
+def read_manifest(m):
+    """Manifest written by the last sync to m"""
+    try:
+        manifest = json.loads(bytes(m[SYNC_MANIFEST_KEY]))
+    except (KeyError, ValueError, TypeError):
+        return None
+    if not isinstance(manifest, dict) or "items" not in manifest:
+        return None
+    return manifest
+
+
+def manifest_paths(node, prefix, sep):
+    """Paths written for a manifest node"""
+    if not isinstance(node, dict):
+        yield prefix
+        return
+    for label, item in node["items"].items():
+        path = prefix + sep + label if prefix else label
+        yield from manifest_paths(item, path, sep)
+
+
+def sync_node(tree, old, prefix, sep, changed, stale, synced, key=None):
+    """Manifest node of tree, the merkle key and the tokens of its
+    values. Adds the paths that differ from the old node to changed
+    and the paths that are gone to stale. Values whose token is not
+    reproducible keep their old token while the same object is
+    synced again, synced maps their paths to the objects.
+    key is the merkle key of tree if the caller already has it.
+    """
+    if old is not None and old["key"] == key:
+        return old
+    hasher = _merkle_hasher()
+    key, merkle = hasher.collect_object(tree)
+    if old is not None and old["key"] == key:
+        return old
+    old_items = old["items"] if old is not None else {}
+    refs = merkle.to_label_dict()
+    values = tree.to_label_dict()
+    values[TREECLASS_KEY] = class_fullname(tree)
+    items = {}
+    for label, v in values.items():
+        path = prefix + sep + label if prefix else label
+        prev = old_items.get(label)
+        if isinstance(v, BaseTree):
+            if not isinstance(prev, dict):
+                if prev is not None:
+                    stale.append(path)
+                prev = None
+            items[label] = sync_node(v, prev, path, sep, changed, stale,
+                                     synced, refs[label].key)
+            continue
+        if isinstance(prev, dict):
+            stale.extend(manifest_paths(prev, path, sep))
+            prev = None
+        if label == TREECLASS_KEY:
+            token = hasher.hash(v)
+        else:
+            token = refs[label].key
+        if token != prev:
+            if prev is not None and path in synced and synced[path] is v:
+                # same object as last time, its token is random
+                token = prev
+            elif hasher.hash(v) != token:
+                synced[path] = v
+            else:
+                synced.pop(path, None)
+        if token != prev:
+            changed[path] = v
+        items[label] = token
+    for label, item in old_items.items():
+        if label not in items:
+            path = prefix + sep + label if prefix else label
+            stale.extend(manifest_paths(item, path, sep))
+    return {"key": key, "items": items}
+
+
+@lru_cache()
+def _merkle_hasher():
+    from ..storage import ContentAddressableStorage
+    return ContentAddressableStorage({}, verify="off", tokenizer="stream")
+
+
+def deref_parallel(tree, store, max_workers=8):
+    """Dereference a merkle tree one level at a time, fetching
+    and decoding all children of a level on a thread pool.
+    """
+    def fetch(key):
+        obj = store.cat_object(key, deref=False)
+        if not isinstance(obj, BaseTree) and hasattr(obj, "deref"):
+            obj = obj.deref(store)
+        return obj
+
+    nodes = []
+    level = [tree]
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while level:
+            slots = []
+            for node in level:
+                items = dict(node.items())
+                nodes.append((node, items))
+                for k, v in items.items():
+                    if isinstance(v, ObjectRef):
+                        slots.append((items, k, v.key))
+            objs = executor.map(fetch, [key for _, _, key in slots])
+            level = []
+            for (items, k, _), obj in zip(slots, objs):
+                items[k] = obj
+                if isinstance(obj, BaseTree):
+                    level.append(obj)
+    derefed = {}
+    for node, items in reversed(nodes):
+        items = {
+            k: derefed.get(id(v), v) if isinstance(v, BaseTree) else v
+            for k, v in items.items()
+        }
+        derefed[id(node)] = node.__class__.from_dict(items)
+    return derefed[id(tree)]
+
+
 def get_edits(diff):
     edits = diff.__class__()
     for k, v in diff.items():
@@ -280,3 +509,20 @@ def get_edits(diff):
 @normalize_token.register(BaseTree)
 def normalize_tree(tree):
     return tuple((k, normalize_token(tree[k])) for k in sorted(tree.keys()))
+
+
+@stream_token.register(BaseTree)
+def stream_tree(tree, stream):
+    if normalize_token.dispatch(type(tree)) is not normalize_tree:
+        return stream_object(tree, stream)
+    keys = sorted(tree.keys())
+    stream.write("(")
+    for i, k in enumerate(keys):
+        if i:
+            stream.write(", ")
+        stream.write(f"({k!r}, ")
+        stream_token(tree[k], stream)
+        stream.write(")")
+    if len(keys) == 1:
+        stream.write(",")
+    stream.write(")")
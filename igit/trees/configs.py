@@ -39,7 +39,7 @@ class ConfigTree(LabelTree):
             keys = self._mapping.keys()
         merged = []
         for k in keys:
-            v = self._mapping[k]
+            v = self[k]
             if isinstance(v, BaseIntervalTree):
                 ivs = v.overlap(start, end)
             else:
@@ -1,7 +1,9 @@
+import bisect
 import datetime
 from collections.abc import Iterable, Mapping, MutableMapping
 from numbers import Number
 
+import numpy as np
 import pandas as pd
 from intervaltree import Interval, IntervalTree
 
@@ -13,6 +15,7 @@ from .labels import LabelTree
 
 class BaseIntervalTree(BaseTree):
     _tree: IntervalTree
+    _tree_class = IntervalTree
 
     @staticmethod
     def compatible_keys(keys):
@@ -28,12 +31,12 @@ class BaseIntervalTree(BaseTree):
     @classmethod
     def from_dict(cls, d):
         ivs = [Interval(*k, v) for k, v in d.items()]
-        return cls(IntervalTree(ivs))
+        return cls(cls._tree_class(ivs))
 
     @classmethod
     def from_label_dict(cls, d):
         ivs = [Interval(*cls.label_to_key(k), v) for k, v in d.items()]
-        return cls(IntervalTree(ivs))
+        return cls(cls._tree_class(ivs))
 
     def add_group(self, name, group):
         self[name] = group
@@ -55,23 +58,38 @@ class BaseIntervalTree(BaseTree):
         raise NotImplementedError
 
     def to_label_dict(self):
+        self.load_all()
         return {
             self.key_to_label((iv.begin, iv.end)): iv.data
             for iv in sorted(self._tree)
         }
 
     def to_dict(self):
+        self.load_all()
         return {(iv.begin, iv.end): iv.data for iv in sorted(self._tree)}
 
+    def _data(self, iv):
+        return self._load((iv.begin, iv.end), iv.data)
+
+    def _get_raw(self, key):
+        for iv in self._tree.overlap(*key):
+            if (iv.begin, iv.end) == key:
+                return iv.data
+        raise KeyError(key)
+
+    def _set_loaded(self, key, old, new):
+        self._tree.remove(Interval(*key, old))
+        self._tree.addi(*key, new)
+
     def __init__(self, tree=None, *args, **kwargs):
         if tree is None:
-            tree = IntervalTree()
-        elif isinstance(tree, IntervalTree):
-            tree = tree
+            tree = self._tree_class()
         elif isinstance(tree, BaseIntervalTree):
             tree = tree._tree
-        else:
+        if not isinstance(tree, (IntervalTree, ColumnarIntervals)):
             raise TypeError("tree must be an instance of IntervalTree.")
+        if not isinstance(tree, self._tree_class):
+            tree = self._tree_class(tree)
         self._tree = tree
 
     def __getitem__(self, key):
@@ -101,6 +119,7 @@ class BaseIntervalTree(BaseTree):
         return self._tree.end()
 
     def __setitem__(self, key, value):
+        self.load_all()
         if isinstance(key, str):
             key = self.label_to_key(key)
         if isinstance(key, slice):
@@ -131,6 +150,7 @@ class BaseIntervalTree(BaseTree):
                 self.set_interval(begin, end, val)
 
     def __delitem__(self, key):
+        self.load_all()
         if isinstance(key, str):
             key = self.label_to_key(key)
         elif isinstance(key, tuple) and len(key) == 2:
@@ -139,6 +159,7 @@ class BaseIntervalTree(BaseTree):
             self._tree.chop(key.start, key.end)
         else:
             raise TypeError("Must pass a tuple of (begin,end) or slice.")
+        self.touch()
 
     def keys(self):
         for iv in sorted(self._tree):
@@ -148,10 +169,12 @@ class BaseIntervalTree(BaseTree):
         return map(self.key_to_label, self.keys())
 
     def items(self):
+        self.load_all()
         for iv in sorted(self._tree):
             yield (iv.begin, iv.end), iv.data
 
     def values(self):
+        self.load_all()
         for iv in sorted(self._tree):
             yield iv.data
 
@@ -168,25 +191,26 @@ class BaseIntervalTree(BaseTree):
         return bool(self[key])
 
     def __getstate__(self):
+        self.load_all()
         return tuple(sorted([tuple(iv) for iv in self._tree]))
 
     def __setstate__(self, d):
         ivs = [Interval(*iv) for iv in d]
-        self._tree = IntervalTree(ivs)
+        self._tree = self._tree_class(ivs)
 
     def overlap(self, begin, end):
         begin, end = self._validate_itype(begin, end)
         hits = sorted(self._tree.overlap(begin, end))
         return [
-            Interval(max(iv.begin, begin), min(iv.end, end), iv.data)
+            Interval(max(iv.begin, begin), min(iv.end, end), self._data(iv))
             for iv in hits
         ]
 
     def overlap_content(self, begin, end):
         hits = sorted(self._tree.overlap(begin, end))
         if len(hits) == 1:
-            return hits[0].data
-        return [hit.data for hit in hits]
+            return self._data(hits[0])
+        return [self._data(hit) for hit in hits]
 
     def value(self, index):
         index, = self._validate_itype(index)
@@ -194,17 +218,19 @@ class BaseIntervalTree(BaseTree):
         if not hits:
             raise KeyError(f'No data overlapps {index}')
         if len(hits) == 1:
-            return hits[0].data
-        return hits
+            return self._data(hits[0])
+        return [Interval(iv.begin, iv.end, self._data(iv)) for iv in hits]
 
     def values_at(self, indices):
         indices = self._validate_itype(*indices)
         return [self.value(i) for i in indices]
 
     def set_interval(self, begin, end, value):
+        self.load_all()
         begin, end = self._validate_itype(begin, end)
         self._tree.chop(begin, end)
         self._tree.addi(begin, end, value)
+        self.touch()
 
     def to_df(self, title="tree"):
         import pandas as pd
@@ -285,6 +311,7 @@ class IntIntervalTree(BaseIntervalTree):
         return tuple(map(int, label.split("-")))
 
     def to_label_dict(self):
+        self.load_all()
         return {f"{iv.begin}-{iv.end}": iv.data for iv in sorted(self._tree)}
 
     def _validate_itype(self, *args):
@@ -320,6 +347,265 @@ class TimeIntervalTree(BaseIntervalTree):
         return tuple(pd.to_datetime(arg, unit=self.unit) for arg in args)
 
 
+class ColumnarIntervals:
+    """Integer intervals stored as numpy arrays of begin, end and
+    payload index, sorted by (begin, end). Implements the part of
+    the intervaltree.IntervalTree interface the interval trees use.
+    Lookups are binary searches while no intervals overlap, which
+    is kept by set_interval, and linear scans otherwise.
+
+    While the intervals are disjoint, updates do not copy the
+    arrays: chop trims them in place and marks removed intervals
+    with a payload index of -1, new intervals go to a small sorted
+    buffer that is merged into the arrays every PENDING_SIZE
+    updates or before a vectorized read.
+    """
+    PENDING_SIZE = 1024
+
+    def __init__(self, intervals=()):
+        intervals = list(intervals)
+        for iv in intervals:
+            if iv.begin >= iv.end:
+                raise ValueError(f"IntervalTree: Null Interval objects not "
+                                 f"allowed in IntervalTree: {iv}")
+        self.payloads = [iv.data for iv in intervals]
+        self._set(np.array([iv.begin for iv in intervals], dtype=np.int64),
+                  np.array([iv.end for iv in intervals], dtype=np.int64),
+                  np.arange(len(intervals), dtype=np.int64))
+
+    def _set(self, begins, ends, pidx):
+        keep = pidx >= 0
+        begins, ends, pidx = begins[keep], ends[keep], pidx[keep]
+        order = np.lexsort((ends, begins))
+        self.begins = begins[order]
+        self.ends = ends[order]
+        self.pidx = pidx[order]
+        self.disjoint = bool(np.all(self.ends[:-1] <= self.begins[1:]))
+        self.removed = 0
+        # buffered intervals, sorted and disjoint: begin, end, payload index
+        self.pending = ([], [], [])
+        self._compact()
+
+    def _flush(self):
+        """Merge the buffered intervals into the arrays and drop the
+        removed ones.
+        """
+        pb, pe, pp = self.pending
+        if not pb and not self.removed:
+            return
+        keep = self.pidx >= 0
+        begins, ends = self.begins[keep], self.ends[keep]
+        pidx = self.pidx[keep]
+        if pb:
+            # the buffer is sorted and disjoint from the arrays
+            pos = np.searchsorted(begins, pb)
+            begins = np.insert(begins, pos, pb)
+            ends = np.insert(ends, pos, pe)
+            pidx = np.insert(pidx, pos, pp)
+        self.begins, self.ends, self.pidx = begins, ends, pidx
+        self.removed = 0
+        self.pending = ([], [], [])
+        self._compact()
+
+    def _compact(self):
+        if self.removed or self.pending[0]:
+            return
+        if len(self.payloads) > 2 * len(self.pidx) + 16:
+            # drop the payloads of removed intervals
+            self.payloads = [self.payloads[i] for i in self.pidx.tolist()]
+            self.pidx = np.arange(len(self.pidx), dtype=np.int64)
+
+    def _push(self, begin, end, p):
+        pb, pe, pp = self.pending
+        i = bisect.bisect_left(pb, begin)
+        pb.insert(i, begin)
+        pe.insert(i, end)
+        pp.insert(i, p)
+
+    def interval(self, i):
+        return Interval(int(self.begins[i]), int(self.ends[i]),
+                        self.payloads[self.pidx[i]])
+
+    def _pending_interval(self, i):
+        pb, pe, pp = self.pending
+        return Interval(pb[i], pe[i], self.payloads[pp[i]])
+
+    def _span(self, begin, end):
+        """Positions [start, stop) of the arrays and the buffer that
+        may overlap [begin, end). Only valid while disjoint.
+        """
+        pb, pe, _ = self.pending
+        return (int(np.searchsorted(self.ends, begin, side="right")),
+                int(np.searchsorted(self.begins, end, side="left")),
+                bisect.bisect_right(pe, begin), bisect.bisect_left(pb, end))
+
+    def lookup(self, points):
+        """Position of the interval containing each point, -1 where
+        there is none. Only valid while the intervals are disjoint.
+        """
+        self._flush()
+        points = np.asarray(points, dtype=np.int64)
+        pos = np.searchsorted(self.begins, points, side="right") - 1
+        hit = pos >= 0
+        hit[hit] = points[hit] < self.ends[pos[hit]]
+        return np.where(hit, pos, -1)
+
+    def payloads_at(self, pos):
+        return [self.payloads[i] for i in self.pidx[pos].tolist()]
+
+    def at(self, point):
+        return self.overlap(point, point + 1)
+
+    def overlap(self, begin, end):
+        if begin >= end:
+            return []
+        if self.disjoint:
+            start, stop, pstart, pstop = self._span(begin, end)
+            ivs = [
+                self.interval(i) for i in range(start, stop)
+                if self.pidx[i] >= 0
+            ]
+            ivs.extend(map(self._pending_interval, range(pstart, pstop)))
+            return sorted(ivs)
+        self._flush()
+        hits = (self.begins < end) & (self.ends > begin)
+        return [self.interval(i) for i in np.flatnonzero(hits)]
+
+    def addi(self, begin, end, data=None):
+        if begin >= end:
+            raise ValueError(f"IntervalTree: Null Interval objects not "
+                             f"allowed in IntervalTree: {(begin, end)}")
+        self.payloads.append(data)
+        p = len(self.payloads) - 1
+        if self.disjoint:
+            start, stop, pstart, pstop = self._span(begin, end)
+            if pstart == pstop and not np.any(self.pidx[start:stop] >= 0):
+                self._push(int(begin), int(end), p)
+                if len(self.pending[0]) >= self.PENDING_SIZE:
+                    self._flush()
+                return
+        self._flush()
+        self._set(np.append(self.begins, begin), np.append(self.ends, end),
+                  np.append(self.pidx, p))
+
+    def add(self, interval):
+        self.addi(*interval)
+
+    def remove(self, interval):
+        begin, end, data = interval
+        lo = np.searchsorted(self.begins, begin, side="left")
+        hi = np.searchsorted(self.begins, begin, side="right")
+        for i in range(lo, hi):
+            p = self.pidx[i]
+            if p < 0 or self.ends[i] != end:
+                continue
+            if self.payloads[p] is data or equal(self.payloads[p], data):
+                self.pidx[i] = -1
+                self.removed += 1
+                return
+        pb, pe, pp = self.pending
+        for i in range(bisect.bisect_left(pb, begin),
+                       bisect.bisect_right(pb, begin)):
+            payload = self.payloads[pp[i]]
+            if pe[i] == end and (payload is data or equal(payload, data)):
+                del pb[i], pe[i], pp[i]
+                return
+        raise ValueError(interval)
+
+    def chop(self, begin, end):
+        """Remove [begin, end) from all intervals, trimming and
+        splitting the ones that overlap it partially.
+        """
+        if self.disjoint:
+            start, stop, pstart, pstop = self._span(begin, end)
+            if start < stop:
+                self._chop_arrays(start, stop, begin, end)
+            if pstart < pstop:
+                self._chop_pending(pstart, pstop, begin, end)
+            if len(self.pending[0]) >= self.PENDING_SIZE:
+                self._flush()
+            return
+        self._flush()
+        hits = (self.begins < end) & (self.ends > begin)
+        if not hits.any():
+            return
+        b, e, p = self.begins[hits], self.ends[hits], self.pidx[hits]
+        left, right = b < begin, e > end
+        self._set(
+            np.concatenate([self.begins[~hits], b[left],
+                            np.full(right.sum(), end, dtype=np.int64)]),
+            np.concatenate([self.ends[~hits],
+                            np.full(left.sum(), begin, dtype=np.int64),
+                            e[right]]),
+            np.concatenate([self.pidx[~hits], p[left], p[right]]))
+
+    def _chop_arrays(self, start, stop, begin, end):
+        # trimming keeps both arrays sorted, so only a split needs
+        # a new entry, which goes to the buffer
+        first, last = start, stop - 1
+        if self.pidx[first] >= 0 and self.begins[first] < begin:
+            if first == last and self.ends[last] > end:
+                self._push(int(end), int(self.ends[last]),
+                           int(self.pidx[last]))
+            self.ends[first] = begin
+            start += 1
+        if start <= last and self.pidx[last] >= 0 and self.ends[last] > end:
+            self.begins[last] = end
+            stop -= 1
+        covered = self.pidx[start:stop]
+        self.removed += int(np.count_nonzero(covered >= 0))
+        covered[:] = -1
+
+    def _chop_pending(self, start, stop, begin, end):
+        pb, pe, pp = self.pending
+        first, last = start, stop - 1
+        if pb[first] < begin:
+            if first == last and pe[last] > end:
+                self._push(end, pe[last], pp[last])
+            pe[first] = begin
+            start += 1
+        if start <= last and pe[last] > end:
+            pb[last] = end
+            stop -= 1
+        del pb[start:stop], pe[start:stop], pp[start:stop]
+
+    def begin(self):
+        self._flush()
+        return int(self.begins[0]) if len(self.begins) else 0
+
+    def end(self):
+        self._flush()
+        return int(self.ends.max()) if len(self.ends) else 0
+
+    def union(self, other):
+        return IntervalTree(self).union(other)
+
+    def __iter__(self):
+        self._flush()
+        for i in range(len(self.begins)):
+            yield self.interval(i)
+
+    def __len__(self):
+        return len(self.begins) - self.removed + len(self.pending[0])
+
+
+class ColumnarIntIntervalTree(IntIntervalTree):
+    """IntIntervalTree on the ColumnarIntervals backend, values_at
+    answers all indices with a single vectorized search.
+    """
+    _tree_class = ColumnarIntervals
+
+    def values_at(self, indices):
+        if self._lazy_keys or not self._tree.disjoint:
+            return super().values_at(indices)
+        indices = np.fromiter(self._validate_itype(*indices), dtype=np.int64)
+        pos = self._tree.lookup(indices)
+        missing = np.flatnonzero(pos < 0)
+        if len(missing):
+            raise KeyError(f'No data overlapps {indices[missing[0]]}')
+        return self._tree.payloads_at(pos)
+
+
 def collect_intervals(tree, parent=(), merge_names=True, join_char="_"):
     ivs = []
     if isinstance(tree, BaseIntervalTree):
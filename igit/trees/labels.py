@@ -20,6 +20,7 @@ class LabelTree(BaseTree):
         return cls(d)
 
     def to_dict(self):
+        self.load_all()
         return dict(self._mapping)
 
     @classmethod
@@ -36,6 +37,7 @@ class LabelTree(BaseTree):
         return self._mapping.keys()
 
     def items(self):
+        self.load_all()
         return self._mapping.items()
 
     def diff(self, other):
@@ -65,20 +67,32 @@ class LabelTree(BaseTree):
             return self.__getattribute__(key)
         except Exception as e:
             if key in self._mapping:
-                return self._mapping.get(key)
+                return self[key]
             else:
                 raise e
 
     def __getitem__(self, key):
         if key in self._mapping:
-            return self._mapping[key]
+            return self._load(key, self._mapping[key])
         raise KeyError(f"attribute {key} not found")
 
     def __setitem__(self, key, value):
+        if self._lazy_keys:
+            self._lazy_keys.discard(key)
         self._mapping[key] = value
+        self.touch()
 
     def __delitem__(self, key):
+        if self._lazy_keys:
+            self._lazy_keys.discard(key)
         del self._mapping[key]
+        self.touch()
+
+    def _get_raw(self, key):
+        return self._mapping[key]
+
+    def _set_loaded(self, key, old, new):
+        self._mapping[key] = new
 
     def __iter__(self):
         return iter(self._mapping)
@@ -99,7 +113,7 @@ class LabelTree(BaseTree):
         return BaseTree.__repr__(self)
 
     def __getstate__(self):
-        return sorted(self._mapping.items())
+        return sorted(self.items())
 
     def __setstate__(self, d):
         self._mapping = dict(d)
@@ -0,0 +1,271 @@
+from collections.abc import Mapping
+
+from .labels import LabelTree
+
+BITS = 5
+MASK = (1 << BITS) - 1
+HASH_BITS = 64
+
+
+def key_hash(key):
+    return hash(key) & ((1 << HASH_BITS) - 1)
+
+
+def single_entry(node):
+    """The only entry of node if it is a key value entry"""
+    if len(node.entries) == 1 and isinstance(node.entries[0], tuple):
+        return node.entries[0]
+    return None
+
+
+def pair_node(entry1, entry2, shift):
+    """Node holding two entries whose hashes agree below shift"""
+    if shift >= HASH_BITS:
+        return CollisionNode((entry1, entry2))
+    node, _ = BitmapNode().set(entry1, shift)
+    node, _ = node.set(entry2, shift)
+    return node
+
+
+class BitmapNode:
+    """Node of a hash array mapped trie. Slot i of the 32 slots is
+    in use if bit i of bitmap is set, entries holds the used slots
+    in order, either (hash, key, value) tuples or child nodes.
+    Nodes are never modified, updates return new nodes sharing
+    the unchanged children.
+    """
+    __slots__ = ("bitmap", "entries")
+
+    def __init__(self, bitmap=0, entries=()):
+        self.bitmap = bitmap
+        self.entries = entries
+
+    def index(self, bit):
+        return bin(self.bitmap & (bit - 1)).count("1")
+
+    def get(self, h, key, shift, default):
+        bit = 1 << ((h >> shift) & MASK)
+        if not self.bitmap & bit:
+            return default
+        entry = self.entries[self.index(bit)]
+        if isinstance(entry, tuple):
+            if entry[0] == h and entry[1] == key:
+                return entry[2]
+            return default
+        return entry.get(h, key, shift + BITS, default)
+
+    def set(self, new, shift):
+        """Returns the updated node and whether a key was added"""
+        h, key, value = new
+        bit = 1 << ((h >> shift) & MASK)
+        idx = self.index(bit)
+        entries = self.entries
+        if not self.bitmap & bit:
+            entries = entries[:idx] + (new, ) + entries[idx:]
+            return BitmapNode(self.bitmap | bit, entries), True
+        entry = entries[idx]
+        if isinstance(entry, tuple):
+            if entry[0] == h and entry[1] == key:
+                if entry[2] is value:
+                    return self, False
+                child, added = new, False
+            else:
+                child, added = pair_node(entry, new, shift + BITS), True
+        else:
+            child, added = entry.set(new, shift + BITS)
+            if child is entry:
+                return self, False
+        entries = entries[:idx] + (child, ) + entries[idx + 1:]
+        return BitmapNode(self.bitmap, entries), added
+
+    def delete(self, h, key, shift):
+        bit = 1 << ((h >> shift) & MASK)
+        if not self.bitmap & bit:
+            raise KeyError(key)
+        idx = self.index(bit)
+        entries = self.entries
+        entry = entries[idx]
+        if isinstance(entry, tuple):
+            if entry[0] != h or entry[1] != key:
+                raise KeyError(key)
+            child = None
+        else:
+            child = entry.delete(h, key, shift + BITS)
+            if not child.entries:
+                child = None
+            else:
+                # a child left with a single entry is replaced by it
+                child = single_entry(child) or child
+        if child is None:
+            return BitmapNode(self.bitmap & ~bit,
+                              entries[:idx] + entries[idx + 1:])
+        return BitmapNode(self.bitmap,
+                          entries[:idx] + (child, ) + entries[idx + 1:])
+
+    def __iter__(self):
+        for entry in self.entries:
+            if isinstance(entry, tuple):
+                yield entry
+            else:
+                yield from entry
+
+
+class CollisionNode:
+    """Entries whose keys have the same hash"""
+    __slots__ = ("entries", )
+
+    def __init__(self, entries):
+        self.entries = entries
+
+    def find(self, key):
+        for i, entry in enumerate(self.entries):
+            if entry[1] == key:
+                return i
+        return None
+
+    def get(self, h, key, shift, default):
+        i = self.find(key)
+        return default if i is None else self.entries[i][2]
+
+    def set(self, new, shift):
+        i = self.find(new[1])
+        if i is None:
+            return CollisionNode(self.entries + (new, )), True
+        if self.entries[i][2] is new[2]:
+            return self, False
+        entries = self.entries[:i] + (new, ) + self.entries[i + 1:]
+        return CollisionNode(entries), False
+
+    def delete(self, h, key, shift):
+        i = self.find(key)
+        if i is None:
+            raise KeyError(key)
+        return CollisionNode(self.entries[:i] + self.entries[i + 1:])
+
+    def __iter__(self):
+        return iter(self.entries)
+
+
+_missing = object()
+
+
+class Hamt(Mapping):
+    """Immutable mapping stored as a hash array mapped trie.
+    set and delete return new mappings in O(log32(n)) that
+    share all untouched nodes with the original.
+    Iteration order follows the key hashes.
+    """
+    __slots__ = ("root", "size")
+
+    def __init__(self, mapping=None, **kwargs):
+        self.root = BitmapNode()
+        self.size = 0
+        items = dict(mapping or {}, **kwargs).items()
+        for k, v in items:
+            self.root, added = self.root.set((key_hash(k), k, v), 0)
+            self.size += added
+
+    @classmethod
+    def _new(cls, root, size):
+        m = cls.__new__(cls)
+        m.root = root
+        m.size = size
+        return m
+
+    def set(self, key, value):
+        root, added = self.root.set((key_hash(key), key, value), 0)
+        if root is self.root:
+            return self
+        return self._new(root, self.size + added)
+
+    def delete(self, key):
+        root = self.root.delete(key_hash(key), key, 0)
+        return self._new(root, self.size - 1)
+
+    def update(self, mapping):
+        m = self
+        for k, v in dict(mapping).items():
+            m = m.set(k, v)
+        return m
+
+    def get(self, key, default=None):
+        return self.root.get(key_hash(key), key, 0, default)
+
+    def __getitem__(self, key):
+        value = self.root.get(key_hash(key), key, 0, _missing)
+        if value is _missing:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        return self.root.get(key_hash(key), key, 0, _missing) is not _missing
+
+    def __iter__(self):
+        for _, k, _ in self.root:
+            yield k
+
+    def items(self):
+        return [(k, v) for _, k, v in self.root]
+
+    def __len__(self):
+        return self.size
+
+    def __repr__(self):
+        return f"Hamt({dict(self.items())!r})"
+
+
+class PersistentLabelTree(LabelTree):
+    """LabelTree backed by a hash array mapped trie.
+
+    Copies share every unchanged node so copy() is O(1) and
+    applying a diff costs O(changes x depth). Item assignment
+    and deletion update the tree itself, set and remove leave
+    it unchanged and return updated copies.
+
+    Only the top level is persistent. Subtrees are stored as they
+    are and shared between the copies, so changing a subtree in
+    place, e.g. tree["sub"]["a"] = 2, changes it in every copy.
+    Replace the subtree instead: tree.set("sub", tree["sub"].set("a", 2))
+    with persistent subtrees.
+    """
+    def __init__(self, mapping=None, **kwargs):
+        if mapping is None:
+            mapping = dict(**kwargs)
+        if not isinstance(mapping, Hamt):
+            mapping = Hamt(mapping)
+        self._mapping = mapping
+
+    def copy(self):
+        tree = self.__class__(self._mapping)
+        if self._lazy_keys:
+            tree._store = self._store
+            tree._lazy_keys = set(self._lazy_keys)
+        return tree
+
+    def set(self, key, value):
+        tree = self.copy()
+        tree[key] = value
+        return tree
+
+    def remove(self, key):
+        tree = self.copy()
+        del tree[key]
+        return tree
+
+    def __setitem__(self, key, value):
+        if self._lazy_keys:
+            self._lazy_keys.discard(key)
+        self._mapping = self._mapping.set(key, value)
+        self.touch()
+
+    def __delitem__(self, key):
+        if self._lazy_keys:
+            self._lazy_keys.discard(key)
+        self._mapping = self._mapping.delete(key)
+        self.touch()
+
+    def _set_loaded(self, key, old, new):
+        self._mapping = self._mapping.set(key, new)
+
+    def __setstate__(self, d):
+        self._mapping = Hamt(dict(d))
@@ -40,3 +40,631 @@ def test_commit(memory_repo):
     memory_repo.add(label_tree=tree)
     ref = memory_repo.commit(f"commit {random.randint(1,10)}")
     assert isinstance(ref, igit.models.CommitRef)
+
+
+def test_repack(memory_repo):
+    tree = igit.LabelTree()
+    tree['packed'] = list(range(10))
+    memory_repo.add(packed_tree=tree)
+    ref = memory_repo.commit("commit before repack")
+    name = memory_repo.repack()
+    assert name is not None
+    packed = memory_repo.objects.find_layer(igit.storage.PackedStorage)
+    assert not packed.loose_keys()
+    assert memory_repo.cat_tree(ref)['packed_tree']['packed'] == list(
+        range(10))
+
+
+def test_key_index(memory_repo):
+    memory_repo.add(indexed=1)
+    memory_repo.commit("commit indexed key")
+    indexed = memory_repo.objects.find_layer(igit.storage.IndexedStorage)
+    keys = sorted(indexed.d.keys())
+    assert keys and keys == list(indexed.index)
+    assert all(k in memory_repo.objects for k in keys)
+    assert igit.storage.KeyIndex.from_bytes(
+        indexed.index_store[indexed.name]).keys == keys
+
+
+def test_object_cache(memory_repo):
+    memory_repo.add(cached=[1, 2, 3])
+    ref = memory_repo.commit("commit cached")
+    cache = memory_repo.objects.find_layer(igit.storage.CachedStorage)
+    cache.clear_cache()
+    memory_repo.cat_tree(ref)
+    misses = cache.info()["misses"]
+    tree = memory_repo.cat_tree(ref)
+    assert cache.info()["misses"] == misses
+    assert cache.info()["hits"] > 0
+    tree["cached"].append(4)
+    assert memory_repo.cat_tree(ref)["cached"] == [1, 2, 3]
+    commit = memory_repo.objects.cat_object(ref.key)
+    commit.message = "tampered"
+    assert memory_repo.objects.cat_object(ref.key).message == "commit cached"
+
+
+def test_fs_check(memory_repo):
+    memory_repo.add(checked="value")
+    memory_repo.commit("commit checked")
+    assert memory_repo.fs_check() == {}
+    key = memory_repo.objects.hash_object("corrupt me", as_ref=False)
+    memory_repo.objects.d.d[key] = "corrupted"
+    assert key in memory_repo.fs_check()
+    del memory_repo.objects.d[key]
+
+
+def test_abbreviated_ref(memory_repo):
+    memory_repo.add(abbreviated=True)
+    ref = memory_repo.commit("commit abbreviated")
+    assert memory_repo.get_ref(ref.key[:12]) == ref
+    with pytest.raises(igit.storage.AmbiguousKeyError):
+        memory_repo.get_ref("")
+
+
+@pytest.fixture(scope="module")
+def async_memory_repo():
+    import fsspec
+    asyn_wrapper = pytest.importorskip(
+        "fsspec.implementations.asyn_wrapper")
+    from fsspec.implementations.memory import MemoryFileSystem
+
+    class AsyncMemoryFileSystem(asyn_wrapper.AsyncFileSystemWrapper):
+        protocol = "asyncmemory"
+
+        def __init__(self, *args, **kwargs):
+            super().__init__(MemoryFileSystem(), *args, **kwargs)
+
+    fsspec.register_implementation("asyncmemory",
+                                   AsyncMemoryFileSystem,
+                                   clobber=True)
+    return igit.init("asyncmemory://igit_async_test")
+
+
+def test_async_objects(async_memory_repo):
+    store = async_memory_repo.async_objects
+    assert store is not None
+    refs = store.run(store.hash_objects(["a", {"b": 1}, [1, 2]]))
+    objs = store.run(store.cat_objects([ref.key for ref in refs]))
+    assert objs == ["a", {"b": 1}, [1, 2]]
+
+    tree = igit.LabelTree(a=1, sub=igit.LabelTree(b="c"))
+    async_memory_repo.add(tree=tree)
+    ref = async_memory_repo.commit("async commit")
+    assert async_memory_repo.cat_tree(ref)["tree"]["sub"]["b"] == "c"
+
+
+def test_parallel_deref(memory_repo):
+    tree = igit.LabelTree(a=1, b=igit.LabelTree(c=[1, 2], d="e"))
+    tree["ivs"] = igit.IntIntervalTree()
+    tree["ivs"][0, 10] = "first"
+    ref = memory_repo.objects.hash_object(tree)
+    expected = ref.deref(memory_repo.objects)
+    result = ref.deref(memory_repo.objects, max_workers=4)
+    assert result == expected
+    assert result["ivs"][5] == "first"
+
+
+def test_lazy_tree(memory_repo):
+    tree = igit.LabelTree(a=1, b=igit.LabelTree(c=[1, 2], d="e"))
+    tree["ivs"] = igit.IntIntervalTree()
+    tree["ivs"][0, 10] = "first"
+    tree["ivs"][10, 20] = "second"
+    memory_repo.add(lazy=tree)
+    ref = memory_repo.commit("commit lazy")
+    lazy = memory_repo.cat_tree(ref, lazy=True)["lazy"]
+    assert lazy.is_lazy
+    assert lazy["b"]["d"] == "e"
+    assert "a" in lazy._lazy_keys
+    assert lazy["ivs"][15] == "second"
+    assert lazy["ivs"].is_lazy
+    assert lazy == memory_repo.cat_tree(ref)["lazy"]
+    assert not lazy.is_lazy
+
+
+def test_object_envelope():
+    store = igit.storage.ObjectStorage({}, serializer="msgpack-dill",
+                                       envelope=True)
+    tree = igit.LabelTree(a=1, b=b"\x00" * 100)
+    store["tree"] = tree
+    data = store.d["tree"]
+    assert data[:3] == b"\xc1IG"
+    assert data[4] == igit.storage.object_store.OTYPE_IDS["tree"]
+    assert store["tree"] == tree
+    # payloads written before envelopes are still readable
+    store.d["legacy"] = store.serialize({"a": 1})
+    assert store["legacy"] == {"a": 1}
+    # raw payloads that look like a json ObjectPacket stay as they are
+    d = {}
+    packet_like = {"otype": "blob", "content": "abc"}
+    igit.storage.ObjectStorage(d, serializer="json-dill")["raw"] = packet_like
+    store = igit.storage.ObjectStorage(d, serializer="json-dill")
+    assert store["raw"] == packet_like
+
+
+def test_bulk_write(memory_repo, monkeypatch):
+    fs = memory_repo.objects.find_layer(igit.storage.PackedStorage).d.fs
+    calls = []
+    pipe = fs.pipe
+
+    def counting_pipe(path, value=None, **kwargs):
+        calls.append(path)
+        return pipe(path, value, **kwargs)
+
+    monkeypatch.setattr(fs, "pipe", counting_pipe)
+    tree = igit.LabelTree(a="bulk", b=igit.LabelTree(c=[3, 4], d="write"))
+    refs = memory_repo.objects.hash_objects([tree, "bulk x"])
+    assert len(calls) == 1
+    assert len(calls[0]) == 6
+    assert memory_repo.objects.cat_object(refs[0].key) == tree
+    assert memory_repo.objects.hash_objects([tree])[0] == refs[0]
+    assert len(calls) == 1
+
+
+def test_zstd_dictionary():
+    pytest.importorskip("zstandard")
+    repo = igit.init("memory://igit_zstd_test")
+    for i in range(200):
+        repo.add(**{f"leaf_{i}": {"name": f"leaf {i}", "values": [i, i + 1]}})
+    old_ref = repo.commit("before training")
+    dict_id = repo.train_compression(dict_size=2**12)
+    assert repo.config.compression_dict_id == dict_id
+    repo.add(trained={"name": "trained", "values": [1, 2]})
+    ref = repo.commit("after training")
+    reopened = igit.IRepo(repo.config)
+    assert reopened.cat_tree(ref)["trained"]["name"] == "trained"
+    assert reopened.cat_tree(old_ref)["leaf_7"]["values"] == [7, 8]
+
+
+def test_chunked_blob():
+    import numpy as np
+    repo = igit.init("memory://igit_chunk_test", chunk_size=2**12)
+    array = np.random.RandomState(0).random_sample((10000, 5))
+    repo.add(array=array)
+    ref = repo.commit("chunked array")
+    keys = set(repo.objects.keys())
+    array[5000] = 0
+    repo.add(array=array)
+    ref2 = repo.commit("edit a row")
+    assert len(set(repo.objects.keys()) - keys) < 10
+    # chunk buffers are not kept alive by the token memo
+    assert len(repo.objects.tokens.strong) == 0
+    assert np.array_equal(repo.cat_tree(ref2)["array"], array)
+    assert repo.cat_tree(ref, lazy=True)["array"][5000, 0] != 0
+
+
+def test_stream_tokenize():
+    import numpy as np
+    from igit.tokenize import stream_tokenize, tokenize
+    tree = igit.LabelTree(a=1,
+                          b=igit.LabelTree(c=[1, (2, "x")], d={"e": None}))
+    tree["ivs"] = igit.IntIntervalTree()
+    tree["ivs"][0, 10] = np.arange(5)
+    objs = [
+        tree, {1: "a", "b": [2.5]}, ("single", ), [], b"bytes", "'quoted\"",
+        igit.models.BlobRef(key="abc")
+    ]
+    for obj in objs:
+        assert stream_tokenize(obj) == tokenize(obj)
+    assert stream_tokenize(*objs, k=1) == tokenize(*objs, k=1)
+
+
+def test_hash_func():
+    repo = igit.init("memory://igit_blake2b_test", hash_func="blake2b")
+    repo.add(hashed="blake2b")
+    ref = repo.commit("blake2b commit")
+    assert len(ref.key) == 40
+    assert repo.fs_check() == {}
+    config = repo.config.copy(update={"hash_func": "sha256"})
+    with pytest.raises(ValueError):
+        igit.IRepo(config)
+    with pytest.raises(ValueError):
+        igit.init("memory://igit_bad_hash_test", hash_func="unknown")
+
+
+def test_token_memo():
+    import numpy as np
+    from igit.tokenize import ARRAY_TOKENS, TokenMemo, tokenize
+    memo = TokenMemo()
+    data = np.frombuffer(b"x" * 2**12, dtype=np.uint8)
+    assert memo.get(data, tokenize) == memo.get(data, tokenize)
+    assert (memo.hits, memo.misses) == (1, 1)
+    assert not memo.memoizable(b"x" * 2**12)
+    array = np.arange(1000)
+    assert not memo.memoizable(array)
+    # arrays that own their memory can be made writeable again
+    array.flags.writeable = False
+    assert not memo.memoizable(array)
+    view = np.arange(1000)[10:]
+    view.flags.writeable = False
+    assert not memo.memoizable(view)
+    array = np.frombuffer(np.arange(1000).tobytes(), dtype=int)
+    assert memo.memoizable(array)
+    assert memo.memoizable(array[10:])
+    token = tokenize(array)
+    hits = ARRAY_TOKENS.hits
+    assert tokenize(igit.LabelTree(a=array)) == tokenize(
+        igit.LabelTree(a=array))
+    assert ARRAY_TOKENS.hits == hits + 2
+    assert tokenize(array) == token
+    key = id(array)
+    del array
+    assert key not in ARRAY_TOKENS.weak
+
+
+def test_merkle_cache():
+    leaf = igit.LabelTree(x=1, y="z")
+    sibling = igit.LabelTree(s=2)
+    tree = igit.LabelTree(branch=igit.LabelTree(leaf=leaf), sibling=sibling)
+    key = tree.merkle_key()
+    assert tree.merkle_key() == key
+    copy = igit.LabelTree(
+        branch=igit.LabelTree(leaf=igit.LabelTree(x=1, y="z")),
+        sibling=igit.LabelTree(s=2))
+    assert tree == copy
+    leaf["x"] = 2
+    assert tree._merkle_keys is None
+    assert sibling._merkle_keys is not None
+    assert tree.merkle_key() != key
+    leaf["x"] = 1
+    assert tree.merkle_key() == key
+    mutable = igit.LabelTree(values=[1, 2])
+    mutable.merkle_key()
+    assert mutable._merkle_keys is None
+
+
+def test_zero_copy_arrays(tmp_path):
+    import mmap
+    import numpy as np
+    repo = igit.init(tmp_path)
+    array = np.arange(100000, dtype=np.float32).reshape(1000, 100)
+    large = np.arange(2**21, dtype=np.float64)
+    repo.add(array=array,
+             fortran=np.asfortranarray(array),
+             large=large,
+             other=[1, 2])
+    ref = repo.commit("arrays")
+    repo.objects.find_layer(igit.storage.CachedStorage).clear_cache()
+    tree = repo.cat_tree(ref)
+    assert np.array_equal(tree["array"], array)
+    assert np.array_equal(tree["fortran"], array)
+    assert np.array_equal(tree["large"], large)
+    assert tree["other"] == [1, 2]
+    for name in ["array", "large"]:
+        base = tree[name]
+        while isinstance(base, np.ndarray):
+            base = base.base
+        assert isinstance(base.obj, mmap.mmap)
+
+
+def test_arrow_frames(tmp_path):
+    pd = pytest.importorskip("pandas")
+    pytest.importorskip("pyarrow")
+    repo = igit.init(tmp_path, serialization="arrow", chunk_size=0)
+    df = pd.DataFrame({"a": range(100), "b": [str(i) for i in range(100)],
+                       "c": 0.5}, index=pd.RangeIndex(100, 200, name="i"))
+    series = pd.Series([1.5, 2.5], index=["x", "y"], name="s")
+    repo.add(df=df, series=series)
+    ref = repo.commit("frames")
+    tree = repo.cat_tree(ref)
+    pd.testing.assert_frame_equal(tree["df"], df)
+    pd.testing.assert_series_equal(tree["series"], series)
+    assert repo.fs_check() == {}
+    key = repo.objects.hash_object(df, as_ref=False)
+    columns = repo.objects.cat_columns(key, ["b"])
+    pd.testing.assert_frame_equal(columns, df[["b"]])
+
+
+def test_typed_serializer():
+    import numpy as np
+    from igit.serializers import CODEC_DILL, CODEC_MSGPACK, CODEC_NPY
+    from igit.serializers import TypedObjectSerializer as serializer
+    objs = [{"a": [1, 2.5, None, b"x"]}, (1, 2), {1: "int key"}, 2**70,
+            igit.LabelTree(a=1), np.arange(10)]
+    codecs = [CODEC_MSGPACK, CODEC_DILL, CODEC_DILL, CODEC_DILL, CODEC_DILL,
+              CODEC_NPY]
+    for obj, codec in zip(objs, codecs):
+        data = serializer.serialize(obj)
+        assert data[0] == codec
+        result = serializer.deserialize(data)
+        assert type(result) is type(obj)
+        if codec == CODEC_NPY:
+            assert np.array_equal(result, obj)
+        else:
+            assert result == obj
+
+
+def test_parallel_encode():
+    import os
+    import threading
+    import zlib
+    threads = set()
+
+    def compress(data):
+        threads.add(threading.get_ident())
+        return zlib.compress(data)
+
+    class Recorder(dict):
+        batches = []
+
+        def setitems(self, items):
+            self.batches.append(list(items))
+            self.update(items)
+
+    raw = Recorder()
+    store = igit.storage.ObjectStorage(
+        igit.storage.FunctionStorage(raw, compress, zlib.decompress),
+        serializer="typed", envelope=True, workers=4, batch_bytes=2**12)
+    items = {f"key_{i:02}": os.urandom(2**12) for i in range(40)}
+    store.setitems(items)
+    assert threading.get_ident() not in threads
+    assert len(raw.batches) > 1
+    assert sum(raw.batches, []) == list(items)
+    assert all(store[k] == v for k, v in items.items())
+
+
+def test_persistent_label_tree(memory_repo):
+    tree = igit.PersistentLabelTree({f"k{i}": i for i in range(1000)})
+    tree["sub"] = igit.PersistentLabelTree(a=1)
+    other = tree.set("k1", -1).remove("k2")
+    other["new"] = "value"
+    assert tree["k1"] == 1 and "k2" in tree and "new" not in tree
+    assert len(other) == len(tree)
+    diff = tree.diff(other)
+    assert sorted(diff.keys()) == ["k1", "k2", "new"]
+    patched = tree.apply_diff(diff)
+    assert patched == other
+    # only the root slots on the paths of the 3 changed keys are new
+    shared = [a is b for a, b in zip(patched._mapping.root.entries,
+                                     tree._mapping.root.entries)]
+    assert sum(shared) >= len(shared) - 3
+    # subtrees are shared, nested updates replace them
+    nested = tree.set("sub", tree["sub"].set("a", 2))
+    assert nested["sub"]["a"] == 2 and tree["sub"]["a"] == 1
+    assert other["sub"] is tree["sub"]
+    memory_repo.add(persistent=other)
+    ref = memory_repo.commit("persistent tree")
+    loaded = memory_repo.cat_tree(ref)["persistent"]
+    assert isinstance(loaded, igit.PersistentLabelTree)
+    assert loaded.to_dict() == other.to_dict()
+
+
+def test_index_tree_cache():
+    repo = igit.init("memory://igit_index_test")
+    repo.add(a=1, b=[1, 2])
+    tree = repo.staged_tree()
+    assert repo.staged_tree() is tree
+    assert repo["a"] == 1
+    other = igit.IRepo(repo.config)
+    assert other.INDEX_TREE == tree
+    other.add(c="from other")
+    assert repo.staged_tree() is not tree
+    assert repo["c"] == "from other"
+    repo.rm("a")
+    assert "a" not in other.INDEX_TREE
+    repo.commit("index cache")
+
+
+def test_incremental_sync():
+    class Recorder(dict):
+        def __init__(self):
+            self.writes, self.deletes = [], []
+
+        def setitems(self, items):
+            self.writes.extend(items)
+            self.update(items)
+
+        def __delitem__(self, key):
+            self.deletes.append(key)
+            super().__delitem__(key)
+
+    m = Recorder()
+    tree = igit.LabelTree({f"k{i}": i for i in range(100)})
+    tree["sub"] = igit.LabelTree(a=1, b=2)
+    tree.sync(m)
+    assert len(m.writes) == 104
+    m.writes.clear()
+    tree["k1"] = -1
+    tree["sub"]["b"] = 3
+    del tree["k2"]
+    tree.sync(m)
+    assert sorted(m.writes) == ["k1", "sub/b"]
+    assert m.deletes == ["k2"]
+    assert igit.LabelTree.from_paths_dict(m) == tree
+    m.writes.clear()
+    tree["k3"] = None
+    tree.sync(m)
+    assert m.writes == ["k3"]
+    assert m["k3"] is None
+
+
+def test_sync_reuses_tokens(monkeypatch):
+    import numpy as np
+    from igit.trees.base import _merkle_hasher
+
+    class Recorder(dict):
+        def __init__(self):
+            self.writes = []
+
+        def setitems(self, items):
+            self.writes.extend(items)
+            self.update(items)
+
+    class Opaque:
+        pass
+
+    hasher = _merkle_hasher()
+    hashed = []
+    tokenize = hasher.tokenize
+
+    def counting_tokenize(*args):
+        hashed.extend(args)
+        return tokenize(*args)
+
+    monkeypatch.setattr(hasher, "tokenize", counting_tokenize)
+    m = Recorder()
+    tree = igit.LabelTree(a=1, obj=Opaque())
+    def frozen(i):
+        return np.frombuffer(bytes([i]) * 2**12, dtype=np.uint8)
+
+    tree["blobs"] = igit.LabelTree({f"b{i}": frozen(i) for i in range(10)})
+    tree["leaf"] = igit.LabelTree(blob=frozen(0), x=1)
+    tree.sync(m)
+    hashed.clear()
+    m.writes.clear()
+    tree["a"] = 2
+    tree["leaf"]["x"] = 2
+    tree.sync(m)
+    assert sorted(m.writes) == ["a", "leaf/x"]
+    assert not [v for v in hashed if isinstance(v, np.ndarray)]
+    m.writes.clear()
+    tree.sync(m)
+    assert m.writes == []
+
+
+def test_columnar_interval_tree(memory_repo):
+    rng = random.Random(0)
+    trees = [igit.IntIntervalTree(), igit.ColumnarIntIntervalTree()]
+    for i in range(200):
+        begin = rng.randrange(0, 1000)
+        end = begin + rng.randrange(1, 50)
+        for tree in trees:
+            tree[begin, end] = i
+    tree, columnar = trees
+    assert list(columnar.items()) == list(tree.items())
+    points = [rng.randrange(tree.start, tree.end) for _ in range(500)]
+    points = [p for p in points if tree.overlap(p, p + 1)]
+    assert columnar.values_at(points) == tree.values_at(points)
+    assert columnar[points[0]] == tree[points[0]]
+    assert columnar.overlap(100, 400) == tree.overlap(100, 400)
+    with pytest.raises(KeyError):
+        columnar.values_at([tree.end + 1])
+    del columnar[100, 200]
+    del tree[100, 200]
+    assert list(columnar.items()) == list(tree.items())
+    memory_repo.add(columnar=columnar)
+    ref = memory_repo.commit("columnar intervals")
+    loaded = memory_repo.cat_tree(ref)["columnar"]
+    assert isinstance(loaded, igit.ColumnarIntIntervalTree)
+    assert list(loaded.items()) == list(tree.items())
+
+
+def test_columnar_interval_updates(monkeypatch):
+    from igit.trees.intervals import ColumnarIntervals
+    monkeypatch.setattr(ColumnarIntervals, "PENDING_SIZE", 4)
+    rng = random.Random(1)
+    tree, columnar = igit.IntIntervalTree(), igit.ColumnarIntIntervalTree()
+    for i in range(300):
+        begin = rng.randrange(0, 200)
+        end = begin + rng.randrange(1, 30)
+        if i % 5 == 4:
+            del tree[begin, end]
+            del columnar[begin, end]
+        else:
+            tree[begin, end] = i
+            columnar[begin, end] = i
+        assert len(columnar) == len(tree)
+        assert columnar.overlap(begin, end) == tree.overlap(begin, end)
+    assert list(columnar.items()) == list(tree.items())
+
+
+def test_refrozen_array(memory_repo):
+    import numpy as np
+    array = np.zeros(1000)
+    array.flags.writeable = False
+    memory_repo.add(refrozen=array)
+    memory_repo.commit("frozen array")
+    array.flags.writeable = True
+    array[0] = 12345
+    array.flags.writeable = False
+    memory_repo.add(refrozen=array)
+    ref = memory_repo.commit("refrozen array")
+    reopened = igit.IRepo(memory_repo.config)
+    assert reopened.cat_tree(ref)["refrozen"][0] == 12345
+
+
+def test_cached_arrays_not_copied(memory_repo):
+    import numpy as np
+    key = memory_repo.objects.hash_object(np.arange(1000) * 3, as_ref=False)
+    cache = memory_repo.objects.find_layer(igit.storage.CachedStorage)
+    cache.clear_cache()
+    first = memory_repo.objects.cat_object(key)
+    second = memory_repo.objects.cat_object(key)
+    third = memory_repo.objects.cat_object(key)
+    assert cache.info()["hits"] >= 2
+    assert np.shares_memory(first, second)
+    assert np.shares_memory(second, third)
+    assert not first.flags.writeable
+
+
+def test_index_tree_independent():
+    repo = igit.init("memory://igit_detached_index_test")
+    repo.add(sub=igit.LabelTree(x=1, values=[1, 2]))
+    repo.commit("nested")
+    repo.checkout("master")
+    assert not repo.dirty
+    repo.working_tree["sub"]["x"] = 99
+    assert repo["sub"]["x"] == 1
+    assert repo.dirty
+    repo.working_tree["sub"]["x"] = 1
+    repo.commit("again")
+    assert not repo.dirty
+    repo.working_tree["sub"]["values"].append(3)
+    assert repo["sub"]["values"] == [1, 2]
+    assert repo.dirty
+    repo["sub"]["x"] = 5
+    repo.INDEX_TREE["sub"]["x"] = 5
+    assert repo["sub"]["x"] == 1
+    values, sub = [1, 2], igit.LabelTree(x=1)
+    repo.add(added=values, added_tree=sub)
+    values.append(3)
+    sub["x"] = 2
+    ref = repo.commit("added")
+    tree = igit.IRepo(repo.config).cat_tree(ref)
+    assert tree["added"] == [1, 2] and tree["added_tree"]["x"] == 1
+    assert repo.cat_tree(ref) == tree
+
+
+def test_chunked_structured_array():
+    import numpy as np
+    repo = igit.init("memory://igit_chunk_structured_test", chunk_size=2**12)
+    array = np.zeros(20000, dtype=[("a", "<f8"), ("b", "<i4")])
+    array["a"] = np.arange(20000) / 3
+    array["b"] = np.arange(20000)
+    repo.add(records=array)
+    ref = repo.commit("structured array")
+    tree = repo.cat_tree(ref)
+    assert tree["records"].dtype == array.dtype
+    assert np.array_equal(tree["records"], array)
+
+
+def test_repack_by_other_handle():
+    repo = igit.init("memory://igit_repack_reader_test", object_cache_size=0)
+    repo.add(loose="before repack")
+    ref = repo.commit("loose objects")
+    reader = igit.IRepo(repo.config)
+    assert reader.cat_tree(ref)["loose"] == "before repack"
+    repo.repack()
+    assert reader.cat_tree(ref)["loose"] == "before repack"
+
+
+def test_array_buffer_hash():
+    import hashlib
+    import numpy as np
+    from igit.tokenize import get_tokenizer, normalize_token
+    array = np.arange(100)
+    tokenize = get_tokenizer("stream", "sha256")
+    seen = []
+    original = hashlib.sha256
+
+    def sha256(*args):
+        seen.extend(bytes(a) for a in args)
+        return original(*args)
+
+    igit.hashing.HASH_ALGORITHMS["sha256"] = sha256
+    try:
+        tokenize(array)
+    finally:
+        igit.hashing.HASH_ALGORITHMS["sha256"] = original
+    assert array.tobytes() in seen
+    # md5 repos keep their keys
+    assert normalize_token(array)[0] != original(array.tobytes()).hexdigest()